@@ -1,68 +1,76 @@
 import os
 import pandas as pd
-import re
+import argparse
 
-# Function to extract the option letter from the text
-def extract_option_letter(text):
-    if not isinstance(text, str):
-        return None
-    match = re.search(r'Option:\s*[\[\s]*(\w)', text)
-    if match:
-        return match.group(1)
-    else:
-        return text[0].upper()
+from utils.scoring import accuracy_tables, category_report, model_name, score_frames
+from utils.leaderboard import build_leaderboard
+from utils.bootstrap import category_cis, paired_tests
 
 
 if __name__ == '__main__':
-    # Path to the file containing the model's output results
-    file_path = 'result/gpt-4o_output.csv'
+    # Paths to the files containing the models' output results (CSV or Parquet written by run.py).
+    parser = argparse.ArgumentParser(description='Compute the accuracy of model outputs.')
+    parser.add_argument('files', nargs='*', default=['result/gpt-4o_output.csv'],
+                        help='Result files to score, e.g. result/gpt-4o_output.csv result/other_output.parquet')
+    parser.add_argument('--leaderboard', action='store_true',
+                        help='Score every result/*_output.* file and write one model x category table.')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes for the leaderboard.')
+    parser.add_argument('--bootstrap', type=int, default=0, metavar='N',
+                        help='Add bootstrap confidence intervals from N resamples (and paired tests between files).')
+    parser.add_argument('--alpha', type=float, default=0.05, help='1 - confidence level of the intervals.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the bootstrap resamples.')
+    args = parser.parse_args()
 
     # Define the output directory
     output_dir = 'result'
     os.makedirs(output_dir, exist_ok=True)
 
-    # Read the CSV file into a Pandas DataFrame
-    df = pd.read_csv(file_path)
+    if args.leaderboard:
+        # Unchanged result files are not scored again; their scores are cached by file hash.
+        leaderboard = build_leaderboard(output_dir, cache_dir='cache/scores', workers=args.workers)
+        leaderboard.to_csv(os.path.join(output_dir, 'leaderboard.csv'))
+        leaderboard.to_parquet(os.path.join(output_dir, 'leaderboard.parquet'))
+        print(leaderboard.to_string())
+        print(f"Saved leaderboard to {os.path.join(output_dir, 'leaderboard.csv')}")
+        raise SystemExit
 
-    # Apply the `extract_option_letter` function to the 'Output' column
-    # and create a new column 'Extracted_Option' with the extracted letters
-    df['Extracted_Option'] = df['Output'].apply(extract_option_letter)
+    # Read all result files, extract the option letters from the 'Output' column in one vectorized pass
+    # and drop rows without an output.
+    df = score_frames(args.files)
 
-    # Drop rows where 'Extracted_Option' is NaN (i.e., no valid option was extracted)
-    df = df.dropna(subset=['Extracted_Option'])
+    # Accuracy per model and question category, per model and video, and per model, in one groupby pass.
+    tables = accuracy_tables(df)
 
-    # Initialize a list to store accuracy data for each question category
-    accuracy_data = []
+    for file_path in args.files:
+        model = model_name(file_path)
+        accuracy_df = category_report(tables, model)
+        video_df = tables['video'][tables['video']['model'] == model].drop(columns='model')
+        # How many outputs each extraction rule resolved ('none': no valid option found).
+        rules_df = df.loc[df['model'] == model, 'Extraction_Rule'].value_counts().rename_axis('Rule') \
+            .reset_index(name='Num')
+        if args.bootstrap:
+            # Confidence interval of the accuracy, next to the Accuracy and Num columns.
+            cis = category_cis(df, model, accuracy_df['Category'], args.bootstrap, args.alpha, args.seed)
+            accuracy_df = pd.concat([accuracy_df, cis], axis=1)
 
-    # Group the DataFrame by the 'question_category' column
-    for category, group in df.groupby('question_category'):
-        correct_count = (group['Extracted_Option'] == group['answer']).sum()
-        accuracy = correct_count / len(group)
-        accuracy_data.append({
-            'Category': category,
-            'Accuracy': accuracy,
-            'Num': len(group)
-        })
+        # Construct the output file path for the Excel file
+        output_file_name = os.path.splitext(file_path)[0] + '.xlsx'
+        output_file_name = output_file_name.replace('output', 'acc')
+        output_excel_path = os.path.join(output_dir, os.path.basename(output_file_name))
 
-    # Calculate the overall accuracy across all categories
-    total_correct = (df['Extracted_Option'] == df['answer']).sum()
-    total_accuracy = total_correct / len(df)
-    accuracy_data.append({
-        'Category': 'Total',
-        'Accuracy': total_accuracy
-    })
+        # Save the accuracy results to an Excel file
+        with pd.ExcelWriter(output_excel_path) as writer:
+            accuracy_df.to_excel(writer, index=False, sheet_name='Accuracy Results')
+            video_df.to_excel(writer, index=False, sheet_name='Per Video')
+            rules_df.to_excel(writer, index=False, sheet_name='Extraction Rules')
 
-    # Convert the accuracy data list into a DataFrame
-    accuracy_df = pd.DataFrame(accuracy_data)
+        # Print a message indicating the processing is complete
+        print(f"Processed {file_path} and saved results to {output_excel_path}")
 
-    # Construct the output file path for the Excel file
-    output_file_name = file_path.replace('.csv', '.xlsx')
-    output_file_name = output_file_name.replace('output', 'acc')
-    output_excel_path = os.path.join(output_dir, os.path.basename(output_file_name))
-
-    # Save the accuracy results to an Excel file
-    with pd.ExcelWriter(output_excel_path) as writer:
-        accuracy_df.to_excel(writer, index=False, sheet_name='Accuracy Results')
-
-    # Print a message indicating the processing is complete
-    print(f"Processed {file_path} and saved results to {output_excel_path}")
+    if args.bootstrap and len(args.files) > 1:
+        # Paired model-vs-model differences on the questions answered by both models.
+        paired_df = paired_tests(df, args.bootstrap, args.alpha, args.seed)
+        paired_path = os.path.join(output_dir, 'paired_tests.csv')
+        paired_df.to_csv(paired_path, index=False)
+        print(paired_df.to_string(index=False))
+        print(f"Saved paired tests to {paired_path}")
@@ -1,9 +1,16 @@
-import time
 import os
 import re
-import pandas as pd
-import pickle
 import json
+import sys
+
+# The shared API clients live in the utils package at the repository root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.clients import gemini_model, gemini_request_options
+from utils.generation_runner import GenerationRunner
+from utils.mcq_sink import MCQSink, export, import_csv
+from utils.remote_storage import RemoteStorage
+from utils.upload_pipeline import UploadPipeline
+from utils.upload_registry import UploadRegistry
 
 # This script is used for generating multiple-choice questions (MCQs) of Goal Oriented Navigation Tasks for given videos using the Gemini model. For more detail of the Goal Oriented Navigation Tasks, please refer to our paper.
 
@@ -219,6 +226,8 @@ def make_prompt(question_category, video_destination):
 if __name__ == '__main__':
 
     model = "gemini-1.5-flash"
+    # Every generation call times out after `request_timeout` seconds.
+    request_timeout = 60
 
     import google.generativeai as genai
 
@@ -230,105 +239,118 @@ if __name__ == '__main__':
     
     
     MCQ_PATH = rf"PATH\TO\YOUR\MCQ\FILE"  # Replace with your MCQ path. This path should contain the generated MCQ, or where you want the MCQ to be saved.
-    # Open the MCQ file if it exists, otherwise create a new one.
-    if os.path.exists(MCQ_PATH):
-        QA_df = pd.read_csv(MCQ_PATH, index_col=0)
-    else:
-        QA_df = pd.DataFrame(columns=["video_id", "instructions", "question_category", "question", "extracted_answer"])
-        QA_df.to_csv(MCQ_PATH, index=True)
+    # Generated questions are appended to a JSON-lines file next to the MCQ file, from which the MCQ file is
+    # exported at the end of the run (or on demand with `python -m utils.mcq_sink`).
+    MCQ_COLUMNS = ["video_id", "instructions", "question_category", "question", "extracted_answer"]
+    mcq_sink_path = os.path.splitext(MCQ_PATH)[0] + ".jsonl"
+    new_sink = not os.path.exists(mcq_sink_path)
+    mcq_sink = MCQSink(mcq_sink_path)
+    if new_sink and os.path.exists(MCQ_PATH):
+        # Continue an MCQ file written before the JSON-lines file existed.
+        import_csv(MCQ_PATH, mcq_sink)
 
 
     # Gemini
-    # Uploaded videos will be saved in a pkl file, which will be used to check if the video has been uploaded to cloud.
-    # Saving videos to cloud will help accelerate the whole generation process, as you don't need to upload the same video again and again.
-    # The pkl file will be deleted every 8 videos, so that the cloud storage won't be full.
-    upload_vid_list_path = 'upload_vid_list.pkl'
-    if os.path.exists(upload_vid_list_path):
-        with open(upload_vid_list_path, 'rb') as file:
-            upload_vid_list = pickle.load(file)
-    else:
-        upload_vid_list = {}
+    # Uploaded videos are recorded in an SQLite registry under the hash of their content, together with the
+    # remote file name and its expiry. A video that is still in the cloud (also after a restart) is not
+    # uploaded again, which saves the upload and processing time of the same video.
+    upload_registry = UploadRegistry('upload_registry.sqlite')
+    # Uploads are kept in the cloud up to a quota of bytes / files (None for no limit); when a new upload would
+    # exceed it, the least recently used videos that no question is being generated for are deleted.
+    max_remote_bytes = 18 * 1024 ** 3
+    max_remote_files = None
+    remote_storage = RemoteStorage(genai, upload_registry, max_bytes=max_remote_bytes, max_files=max_remote_files)
+    # The next `upload_lookahead` videos are uploaded by `upload_workers` threads while questions are generated
+    # for the earlier ones, and their PROCESSING state is polled together.
+    upload_workers = 2
+    upload_lookahead = 4
+    uploads = UploadPipeline(remote_storage, uploaders=upload_workers, lookahead=upload_lookahead)
+
+    def video_path_of(video_info):
+        return os.path.join(video_path, video_info["video_name"])
 
 
     # Read the video list
     with open(video_list_path, 'r', encoding='utf-8') as file:
         video_list = json.load(file)
 
-    # Get the video files
-    for idx, video_info in enumerate(video_list[:], start=0):
-        video_name = video_info["video_name"]
-        video_destination = video_info["destination"]
-        
-        video_file_name = video_name
-        # Check whether the video file is uploaded to cloud or not
-        try:
-            if video_file_name not in upload_vid_list.keys():
-                print(f"Uploading file", video_file_name)
-                video_file = genai.upload_file(path=os.path.join(video_path, video_file_name))
-                print(f"Completed upload: {video_file.uri}")
-
-                while video_file.state.name == "PROCESSING":
-                    time.sleep(10)
-                    video_file = genai.get_file(video_file.name)
+    # Generation requests run concurrently: the category prompts of up to `max_videos` videos at a time are
+    # sent by `workers` threads, at most `requests_per_minute` per minute (None for no limit).
+    workers = 4
+    max_videos = 2
+    requests_per_minute = 60
+    runner = GenerationRunner(workers=workers, requests_per_minute=requests_per_minute, max_videos=max_videos)
 
-                if video_file.state.name == "FAILED":
-                    raise ValueError(video_file.state.name)
+    # Call the model to generate the question and the choices (in a worker thread).
+    def ask(video, context, question_category):
+        # Make the prompt
+        prompt = make_prompt(question_category, video["destination"])
 
-                upload_vid_list[video_file_name] = video_file
+        client = gemini_model(model)
+        response = runner.generate(client, [video["video_file"], prompt],
+                                   request_options=gemini_request_options(request_timeout))
+        return response.text
 
-                with open(upload_vid_list_path, 'wb') as file:
-                    pickle.dump(upload_vid_list, file)
-
-            else:
-                video_file = upload_vid_list[video_file_name]
-
-            for question_category in question_categories[0:7]:
-                
-                # Make the prompt
-                prompt = make_prompt(question_category, video_destination)
+    # Add a generated question to the MCQ file (in the main thread).
+    def save(video, question_category, content, error):
+        if error is not None:
+            print(f"Error occured: {error}")
+            with open(r"error_log.txt", "a", encoding="utf-8") as f:
+                f.write(f"Error occurred when processing video: {video['video_name']}, category: {question_category}, Error: {error}\n")
+            return
 
-                # Call the model to generate the question and the choices
-                client = genai.GenerativeModel(model_name=model)
-                response = client.generate_content([video_file, prompt],
-                                                    request_options={"timeout": 60})
-                content = response.text
+        # extract the answer given by the model from the response 
+        match = re.search(r'Answer:\s*([A-E])', content)
+        if match:
+            extracted_answer = match.group(1)
+            # print(f"Extracted Answer: {extracted_answer}")
+        else:
+            extracted_answer = "Not Found"
+            print("No answer found")
+        content = re.sub(r'Answer:.*', '', content)
 
-                # extract the answer given by the model from the response 
-                match = re.search(r'Answer:\s*([A-E])', content)
-                if match:
-                    extracted_answer = match.group(1)
-                    # print(f"Extracted Answer: {extracted_answer}")
-                else:
-                    extracted_answer = "Not Found"
-                    print("No answer found")
-                content = re.sub(r'Answer:.*', '', content)
+        # New entry to be added to the MCQ file
+        new_entry = {
+            "video_id": video["video_name"],
+            "destiny": video["destination"],
+            "question_category": question_category,
+            "question": content,
+            "extracted_answer": extracted_answer
+        }
+        print(new_entry)
+        mcq_sink.append(new_entry)
 
-                # New entry to be added to the MCQ file
-                new_entry = {
-                    "video_id": video_file_name,
-                    "destiny": video_destination,
-                    "question_category": question_category,
-                    "question": content,
-                    "extracted_answer": extracted_answer
-                }
-                print(new_entry)
-                new_entry_df = pd.DataFrame([new_entry], index=[QA_df.index.max() + 1 if not QA_df.empty else 0])
-                QA_df = pd.concat([QA_df, new_entry_df], ignore_index=False)
-                QA_df.to_csv(MCQ_PATH, index=True)
-                QA_df.to_excel(MCQ_PATH.replace(".csv", ".xlsx"), index=True)
-                QA_df.to_json(MCQ_PATH.replace(".csv", ".json"), orient='records', lines=True, force_ascii=False)
-                time.sleep(5)
-        except Exception as e:
-            print(f"Error occured: {e}")
-            with open(r"error_log.txt", "a", encoding="utf-8") as f:
-                f.write(f"Error occurred when processing video: {video_file_name}, Error: {e}\n")
-            time.sleep(10)
+    # The MCQ file is exported also if the run is interrupted, so it never lags behind the JSON-lines file.
+    try:
+        # Get the video files; they are uploaded ahead of the generation and come in as soon as they are ready.
+        for video_info, video_file, error in uploads.run(video_list[:], video_path_of):
+            video_name = video_info["video_name"]
+            video_destination = video_info["destination"]
         
-        if idx % 8 == 0:
-            for f in genai.list_files():
-                print("  ", f.name)
-                f.delete()
-            os.remove(upload_vid_list_path)
+            video_file_name = video_name
+            try:
+                if error is not None:
+                    raise error
 
+                # Generate the questions of all categories concurrently; they are saved as they complete.
+                runner.submit({"video_name": video_file_name, "video_file": video_file,
+                               "destination": video_destination},
+                              question_categories[0:7], ask,
+                              done=lambda video: remote_storage.release(video["video_file"]))
+            except Exception as e:
+                print(f"Error occured: {e}")
+                with open(r"error_log.txt", "a", encoding="utf-8") as f:
+                    f.write(f"Error occurred when processing video: {video_file_name}, Error: {e}\n")
 
+            for result in runner.completed():
+                save(*result)
 
+        for result in runner.drain():
+            save(*result)
+        runner.close()
+        print('Uploads: %s; remote storage: %s; pipeline: %s.'
+              % (upload_registry.report(), remote_storage.report(), uploads.report()))
+        upload_registry.close()
+    finally:
+        mcq_sink.close()
+        export(mcq_sink_path, MCQ_PATH, MCQ_PATH.replace(".csv", ".xlsx"), MCQ_PATH.replace(".csv", ".json"), columns=MCQ_COLUMNS)
@@ -1,128 +1,272 @@
-import cv2
-import base64
-import time
-from openai import OpenAI
 import os
-import pandas as pd
 import warnings
-import math
-import copy
+import json
+import argparse
+import time
+
+from utils.frame_cache import FrameCache
+from utils.frame_preprocess import mime_type
+from utils.payload_budget import PayloadBudget
+from utils.scheduler import plan_resume
+from utils.async_engine import AsyncEvaluator, RateLimiter
+from utils.retry import RetryPolicy
+from utils.response_cache import ResponseCache
+from utils.result_journal import ResultJournal, compact, import_csv, read_journal
+from utils.sharding import journal_paths, parse_shard, shard_path, shard_positions
+from utils.dataset_reader import iter_batches, read_questions
+from utils.structured_output import parse_answer, response_format
+from utils.metrics import MetricsRecorder, summarize
+from utils.clients import openai_client
 
 warnings.filterwarnings("ignore")
 
 
+# Create a prompt for the GPT model to answer a question based on the video.
+# In structured mode the answer is requested as a JSON object (with or without a reason).
+def make_prompt(question, structured=False, include_reason=True):
+    prompt = "This video (captured into multiple frames of images as follows) presents the perception data of an agent moving in the environment from a first person perspective. Please answer the following questions: \n"
+    if not structured:
+        prompt += "The template for the answer is: \n\
+                    Option: []; Reason: []\n\
+                    where the Option only outputs one option from 'A' to 'E' here, do not output redundant content. Reason explains why you choose this option."
+    elif include_reason:
+        prompt += 'Answer with a JSON object {"option": "", "reason": ""} and nothing else, where option is one option from \'A\' to \'E\' and reason explains why you choose this option.'
+    else:
+        prompt += 'Answer with a JSON object {"option": ""} and nothing else, where option is one option from \'A\' to \'E\'.'
+
+    # Add the question from the dataset to the prompt.
+    prompt += '\n' + question
+    return prompt
+
+
+# Prepare the prompt and the video content in base64 format for the GPT model.
+def make_messages(prompt, base64Frames_selected, image_format='jpeg'):
+    content = [
+        {
+            "type": "text",
+            "text": prompt
+        }
+    ]
+
+    for buffer in base64Frames_selected:
+        content.append({
+            "type": "image_url",
+            "image_url": {
+                "url": f"data:{mime_type(image_format)};base64,{buffer}"
+            }})
+
+    return [
+        {
+            "role": "user",
+            "content": content
+        }
+    ]
+
+
 # Main execution block
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a model on UrbanVideo-Bench.')
+    parser.add_argument('--shard', default=None,
+                        help="Evaluate only shard i of N (0-based, partitioned by video), e.g. --shard 0/4.")
+    parser.add_argument('--merge', action='store_true',
+                        help='Merge the results of all shards into the result CSV and exit.')
+    args = parser.parse_args()
+
     # Need to input
-    # Define the model name and initialize the OpenAI client with API credentials.
+    # Concurrency and rate limits of the API calls. Set a limit to None to disable it.
+    concurrency = 8  # Maximum number of requests in flight at the same time.
+    requests_per_minute = None
+    tokens_per_minute = None
+
+    # Failed calls (rate limits, timeouts, server errors) are retried with exponential backoff, up to
+    # `max_attempts` per question. Questions that still fail are listed in the dead-letter file.
+    max_attempts = 5
+
+    # Define the model name and initialize the OpenAI client with API credentials. The client keeps a pool of
+    # up to `concurrency` keep-alive connections (HTTP/2 if the `h2` package is installed), and every request
+    # times out after `request_timeout` seconds. Retries are handled by the evaluator, see `max_attempts`.
     model = "xxx"
-    client = OpenAI(
+    request_timeout = 120
+    client = openai_client(
         api_key='xxxxxxxxxxxxxx',  # Replace with your OpenAI API key.
-        base_url='xxxxxxxxxxxxxx'  # Replace with your OpenAI API base URL.
+        base_url='xxxxxxxxxxxxxx',  # Replace with your OpenAI API base URL.
+        max_connections=concurrency,
+        timeout=request_timeout
     )
 
+    # Responses are cached by (model, prompt, frames), so repeated runs skip the network. Entries expire
+    # after `response_cache_ttl` seconds (None keeps them) and the least recently used ones are evicted beyond
+    # `response_cache_max_entries`. Set the path to None to disable the cache.
+    response_cache_path = 'cache/responses.sqlite'
+    response_cache_ttl = 30 * 24 * 3600
+    response_cache_max_entries = 1000000
+
+    # Structured output: the answer is requested as JSON, enforced by a JSON schema (`response_format`) where
+    # the endpoint supports it, and the chosen option is stored in an 'Option' column at request time.
+    # Endpoints without `response_format` support are detected and asked through the prompt alone.
+    # `max_tokens` caps the answer length, e.g. 16 with include_reason=False (None for no limit).
+    structured_output = False
+    include_reason = True
+    max_tokens = None
+    request_params = {}
+    if structured_output:
+        request_params['response_format'] = response_format(include_reason)
+    if max_tokens is not None:
+        request_params['max_tokens'] = max_tokens
+
+    # Prices in USD per million prompt / completion tokens, for the cost estimate of the run summary.
+    prompt_price = None
+    completion_price = None
+
     # Dataset path
     folder_path = 'dataset/videos'  # Define the folder path where video files are stored.
-    QA_df = pd.read_parquet('dataset/MCQ.parquet')  # Read the dataset containing questions and metadata from a Parquet file.
+    dataset_path = 'dataset/MCQ.parquet'  # The dataset containing questions and metadata.
+
+    # Optionally evaluate only some question categories or videos, e.g. ['Object Recall'] (None for all).
+    categories = None
+    video_subset = None
+
+    # Read only the columns needed to ask the questions, and only the rows selected above.
+    QA_df = read_questions(dataset_path, columns=['video_id', 'question'], categories=categories,
+                           video_ids=video_subset)
 
     # Define the folder path for saving results and create it if it doesn't exist.
     folder_path_result = 'result'
     if not os.path.exists(folder_path_result):
         os.makedirs(folder_path_result)
 
-    # Define the path for the result CSV file.
+    # Frame selection: 'every_nth' (the original selection, at most `num_frames` frames), 'uniform' (exactly
+    # `num_frames` evenly spread frames), 'scene' (scene changes) or 'motion' (equal steps of motion).
+    frame_strategy = 'every_nth'
+    num_frames = 32
+
+    # Frame preprocessing: frames are resized so that their longer side is at most `max_side` pixels (None
+    # keeps the native resolution) and encoded as 'jpeg' or 'webp' with the given quality (None for the
+    # OpenCV default) by `encode_workers` threads.
+    max_side = None
+    image_format = 'jpeg'
+    quality = None
+    encode_workers = 4
+
+    # Optional payload budget per request, in bytes of the request body and/or image tokens. Frames that do
+    # not fit are re-encoded with lower quality, then lower resolution, then fewer (evenly spread) frames.
+    max_payload_bytes = None  # e.g. 20 * 1024 * 1024
+    max_image_tokens = None
+    budget = None
+    if max_payload_bytes is not None or max_image_tokens is not None:
+        budget = PayloadBudget(max_bytes=max_payload_bytes, max_image_tokens=max_image_tokens)
+
+    # Sampled frames are cached per video, in memory and on disk, and shared by all questions of a video.
+    frame_cache = FrameCache(cache_dir='cache/frames', max_videos=4, max_frames=num_frames, max_side=max_side,
+                             image_format=image_format, quality=quality, workers=encode_workers, budget=budget,
+                             strategy=frame_strategy)
+
+    # Define the paths of the result journal, the result CSV compacted from it, the dead-letter file and the
+    # per-question metrics file.
+    journal_path = os.path.join(folder_path_result, '%s_output.jsonl' % model)
     res_path = os.path.join(folder_path_result, '%s_output.csv' % model)
+    res_parquet_path = os.path.join(folder_path_result, '%s_output.parquet' % model)
+    dead_letter_path = os.path.join(folder_path_result, '%s_dead_letters.jsonl' % model)
+    metrics_path = os.path.join(folder_path_result, '%s_metrics.jsonl' % model)
 
-    # Check if the result file already exists.
-    if os.path.exists(res_path):
-        # If the file exists, load it and find the last valid index in the 'Output' column.
-        res = pd.read_csv(res_path, index_col=0)
-        last_valid_index = int(res['Output'].last_valid_index())
-        last_valid_index += 1  # Start processing from the next index.
-    else:
-        # If the file doesn't exist, create a new DataFrame based on the QA dataset.
-        res = copy.deepcopy(QA_df)
-        res['Output'] = None  # Add an 'Output' column initialized to None.
-        last_valid_index = 0  # Start processing from the first index.
-
-    # Iterate through each question starting from the last valid index.
-    for qa_idx in range(last_valid_index, res.shape[0]):
-        print('Processing index: %d' % qa_idx)
-
-        # Get the video ID for the current question.
-        select_vid_name = res['video_id'].iloc[qa_idx]
-
-        # Open the video file using OpenCV.
-        video = cv2.VideoCapture(os.path.join(folder_path, str(select_vid_name)))
-        video_fps = video.get(cv2.CAP_PROP_FPS)  # Get the frames per second (FPS) of the video.
-
-        # Initialize a list to store base64-encoded frames.
-        base64Frames = []
-        while video.isOpened():
-            success, frame = video.read()  # Read a frame from the video.
-            if not success:
-                break  # Stop reading if there are no more frames.
-
-            # Encode the frame as a JPEG image and convert it to base64 format.
-            _, buffer = cv2.imencode(".jpg", frame)
-            base64Frames.append(base64.b64encode(buffer).decode("utf-8"))
-
-        # Release the video file and print the number of frames read.
-        video.release()
-        print(len(base64Frames), "frames read.")
-
-        # Create a prompt for the GPT model to answer questions based on the video.
-        prompt = "This video (captured into multiple frames of images as follows) presents the perception data of an agent moving in the environment from a first person perspective. Please answer the following questions: \n"
-        prompt += "The template for the answer is: \n\
-                        Option: []; Reason: []\n\
-                        where the Option only outputs one option from 'A' to 'E' here, do not output redundant content. Reason explains why you choose this option."
-
-        # Add the question from the dataset to the prompt.
-        qa = res['question'].iloc[qa_idx]
-        prompt += '\n' + qa
-
-        try:
-            # Select a subset of frames to reduce the number of frames sent to the model.
-            div_num = math.ceil(len(base64Frames) / 32)  # Divide frames into chunks.
-            base64Frames_selected = base64Frames[0::div_num]  # Select every nth frame.
-
-            # Prepare the video content in base64 format for the GPT model.
-            content = [
-                {
-                    "type": "text",
-                    "text": prompt
-                }
-            ]
-
-            for buffer in base64Frames_selected:
-                content.append({
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/jpeg;base64,{buffer}"
-                    }})
-
-            PROMPT_MESSAGES = [
-                {
-                    "role": "user",
-                    "content": content
-                }
-            ]
-
-            # Send the prompt to the GPT model and get the response.
-            result = client.chat.completions.create(
-                model=model,
-                messages=PROMPT_MESSAGES
-            )
-            print(result.choices[0].message.content)  # Print the model's response.
-            res_str = result.choices[0].message.content  # Extract the response string.
-
-            # Save the response in the 'Output' column of the result DataFrame.
-            res['Output'].iloc[qa_idx] = res_str
-
-        except Exception as e:
-            # Handle errors and wait for 60 seconds before retrying.
-            print(f"An error occurred: {e}")
-            time.sleep(60)
-
-        # Save the updated result DataFrame to the CSV file.
-        res.to_csv(res_path)
\ No newline at end of file
+    if not os.path.exists(journal_path) and os.path.exists(res_path):
+        # Continue from a result CSV written before the journal existed.
+        with ResultJournal(journal_path, model) as journal:
+            import_csv(res_path, journal)
+
+    if args.merge:
+        # Combine the journals of all shards (and of unsharded runs) into the single result CSV.
+        compact(journal_paths(journal_path), iter_batches(dataset_path), res_path, res_parquet_path)
+        print('Merged %s into %s' % (', '.join(journal_paths(journal_path)), res_path))
+        raise SystemExit
+
+    # In shard mode only the videos of this shard are evaluated, and results go to a journal of their own.
+    positions = None
+    run_journal_path = journal_path
+    if args.shard is not None:
+        shard, num_shards = parse_shard(args.shard)
+        positions = shard_positions(QA_df['video_id'].tolist(), shard, num_shards)
+        run_journal_path = shard_path(journal_path, shard, num_shards)
+        dead_letter_path = shard_path(dead_letter_path, shard, num_shards)
+        metrics_path = shard_path(metrics_path, shard, num_shards)
+
+    # Results are appended to the journal as they arrive instead of rewriting the CSV after every question.
+    journal = ResultJournal(run_journal_path, model)
+
+    # Resume exactly: only the questions without a successful output in any journal (never answered, or
+    # failed in an earlier run) are sent again, grouped by video.
+    plan = plan_resume(QA_df['video_id'].tolist(), QA_df.index.tolist(), read_journal(journal_paths(journal_path)),
+                       positions)
+    print(plan.report())
+    pending = plan.pending
+
+    # Time per preprocessing stage of every video and latency, size, tokens and retries of every question.
+    metrics = MetricsRecorder(metrics_path)
+
+    def prepare(vid_name):
+        timings = {}
+        start = time.perf_counter()
+        frames = frame_cache.get(os.path.join(folder_path, str(vid_name)), timings)
+        metrics.video(vid_name, time.perf_counter() - start, len(frames), timings)
+        return frames
+
+    # Append each response to the journal under its original row index.
+    def on_result(qa_idx, res_str, error, info):
+        row = int(QA_df.index[qa_idx])
+        if error is not None:
+            print(f"An error occurred at index {row}: {error}")
+        else:
+            # Print the model's response and the size of the request that produced it.
+            print('Index %d (%.1f KB): %s' % (row, info['payload_bytes'] / 1024, res_str))
+        extra = {}
+        if structured_output and error is None:
+            extra['option'] = parse_answer(res_str, QA_df['question'].iloc[qa_idx])
+        journal.append(row, res_str, error=error, latency=info.get('latency'),
+                       prompt_tokens=info.get('prompt_tokens'), completion_tokens=info.get('completion_tokens'),
+                       attempts=info.get('attempts'), payload_bytes=info.get('payload_bytes'), **extra)
+        metrics.question(row, QA_df['video_id'].iloc[qa_idx], error, info)
+
+    response_cache = None
+    if response_cache_path is not None:
+        response_cache = ResponseCache(response_cache_path, ttl=response_cache_ttl,
+                                       max_entries=response_cache_max_entries)
+
+    # Each video's frames are read once in a worker thread and shared by all of its questions, which are
+    # then sent to the model concurrently. The frames are released once all of its questions are answered.
+    evaluator = AsyncEvaluator(
+        client, model, concurrency=concurrency,
+        rate_limiter=RateLimiter(requests_per_minute, tokens_per_minute),
+        retry_policy=RetryPolicy(max_attempts=max_attempts),
+        response_cache=response_cache,
+        request_params=request_params
+    )
+    try:
+        evaluator.run(
+            plan.groups,
+            prepare=prepare,
+            make_messages=lambda qa_idx, frames: make_messages(
+                make_prompt(QA_df['question'].iloc[qa_idx], structured_output, include_reason), frames, image_format),
+            on_result=on_result,
+            release=lambda vid_name: frame_cache.release(os.path.join(folder_path, str(vid_name))),
+            row_label=lambda qa_idx: QA_df.index[qa_idx]
+        )
+    finally:
+        journal.close()
+        metrics.close()
+        # Also compact after an interruption, so the CSV reflects everything answered so far. Shards leave
+        # this to the merge step, as other shards may still be writing.
+        if args.shard is None:
+            compact(journal_paths(journal_path), iter_batches(dataset_path), res_path, res_parquet_path)
+
+    # Record the questions that could not be answered; they are retried on the next run.
+    with open(dead_letter_path, 'w', encoding='utf-8') as file:
+        for entry in evaluator.dead_letters:
+            file.write(json.dumps(dict(entry, row=int(QA_df.index[entry['position']]))) + '\n')
+    print('%d questions answered, %d failed (see %s).'
+          % (len(pending) - len(evaluator.dead_letters), len(evaluator.dead_letters), dead_letter_path))
+    print('Frames: %s. Preprocessing time: %s.'
+          % (', '.join('%s %d' % item for item in frame_cache.stats.items()),
+             ', '.join('%s %.1f s' % item for item in frame_cache.timings.items()) or 'none'))
+    if response_cache is not None:
+        print('Response cache: %s.' % response_cache.report())
+    print(summarize(metrics_path, prompt_price, completion_price))
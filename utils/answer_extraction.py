@@ -0,0 +1,89 @@
+# Extraction of the chosen option letter from free-text model outputs.
+# An ordered cascade of precompiled patterns is tried on every output, from the most explicit form
+# ("Option: C", a JSON answer) to the loosest one (a letter at the start of the output). A letter is only
+# accepted if it is one of the options of the question (A-C for a three-option question, A-E for five), and
+# the name of the rule that matched is kept, so that parsing problems can be traced per model. The batch API
+# runs each rule once over the whole column with pandas' vectorized string methods, only on the outputs that
+# no earlier rule resolved.
+import re
+
+import numpy as np
+import pandas as pd
+
+
+# Options listed in a question: "A. ...", "B) ...", "(C) ...".
+OPTION_LABEL_PATTERN = re.compile(r'(?:^|\s)\(?([A-Z])[\.\)]\s')
+
+# Used when the options cannot be found in the question (the prompt of run.py allows 'A' to 'E').
+DEFAULT_LAST_OPTION = 'E'
+
+# (rule name, pattern); the first capture group is the option letter.
+RULES = [
+    ('json', re.compile(r'"(?i:option|answer|choice)"\s*:\s*"\s*\[?\s*\(?([A-Za-z])\b')),
+    ('option', re.compile(r'(?i:option)\s*:\s*[\[\s\*]*\(?([A-Za-z])\b')),
+    ('answer', re.compile(r'(?i:answer|choice)\s*(?:is|:)?\s*[:\s\*\[]*\(?([A-Z])\b')),
+    ('bold', re.compile(r'\*\*\s*\(?([A-Z])\b')),
+    ('parenthesized', re.compile(r'\(([A-Z])\)')),
+    ('bare', re.compile(r'(?m)^\s*\[?([A-Z])\]?\s*\.?\s*$')),
+    ('leading', re.compile(r'^\s*\[?([A-Z])(?:[\.\):\],;]|\s|$)')),
+]
+
+RULE_NAMES = [name for name, _ in RULES]
+
+
+# Last option letter of a question, e.g. 'C' for a question with options A, B and C.
+def last_option(question):
+    if not isinstance(question, str):
+        return DEFAULT_LAST_OPTION
+    letters = set(OPTION_LABEL_PATTERN.findall(question))
+    last = None
+    for letter in 'ABCDEFGHIJ':
+        if letter not in letters:
+            break
+        last = letter
+    # A single "A." is more likely part of the text than a list of options.
+    return last if last is not None and last > 'A' else DEFAULT_LAST_OPTION
+
+
+# Option letter and rule name for one output. The rule is 'none' if no rule gives a valid option, and both
+# are None for non-string outputs.
+def extract_option(text, question=None):
+    if not isinstance(text, str):
+        return None, None
+    last = last_option(question)
+    for name, pattern in RULES:
+        match = pattern.search(text)
+        if match:
+            letter = match.group(1).upper()
+            if 'A' <= letter <= last:
+                return letter, name
+    return None, 'none'
+
+
+# Batch version of extract_option over a Series of outputs (and optionally the matching questions).
+# Returns a DataFrame with the same index and the columns 'Extracted_Option' and 'Extraction_Rule'; both are
+# NaN for non-string outputs, and the rule is 'none' for string outputs without a valid option.
+def extract_options_batch(outputs, questions=None):
+    outputs = outputs.where(outputs.map(lambda value: isinstance(value, str))).astype(object)
+    if questions is None:
+        last = pd.Series(DEFAULT_LAST_OPTION, index=outputs.index)
+    else:
+        # Questions repeat across result files of different models, so each distinct one is parsed once.
+        last = questions.astype(object).map(pd.Series({q: last_option(q) for q in questions.unique()}))
+        last = last.fillna(DEFAULT_LAST_OPTION)
+
+    letters = np.full(len(outputs), None, dtype=object)
+    rules = np.where(outputs.notna(), 'none', None).astype(object)
+    pending = outputs.notna().to_numpy(copy=True)
+    last = last.to_numpy(dtype=object)
+    for name, pattern in RULES:
+        if not pending.any():
+            break
+        candidates = outputs[pending].str.extract(pattern, expand=False).str.upper().fillna('')
+        candidates = candidates.to_numpy(dtype=object)
+        valid = (candidates >= 'A') & (candidates <= last[pending])
+        positions = np.flatnonzero(pending)[valid]
+        letters[positions] = candidates[valid]
+        rules[positions] = name
+        pending[positions] = False
+    return pd.DataFrame({'Extracted_Option': letters, 'Extraction_Rule': rules}, index=outputs.index)
@@ -0,0 +1,246 @@
+# Concurrent evaluation engine built on AsyncOpenAI.
+# Frame preparation (decoding, encoding, cache lookups) runs in a thread pool and feeds a bounded queue of
+# ready videos, while the API calls for those videos run concurrently in the event loop. A semaphore
+# bounds the number of in-flight calls and an optional rate limiter keeps requests and tokens per
+# minute under the endpoint's limits. Each result is handed back with its original row position.
+# Failed calls are retried according to a RetryPolicy: a row waiting for its next attempt gives up its
+# concurrency slot, so other rows keep going, and rows that exhaust their budget land in `dead_letters`.
+# With a ResponseCache, requests that were answered before are served from it without a network call.
+# Extra request parameters (e.g. `response_format`, `max_tokens`) are sent with every call and are part of
+# the cache key; if the endpoint rejects `response_format`, it is dropped for the rest of the run.
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.retry import EmptyResponseError, RetryPolicy, classify_error
+from utils.payload_budget import payload_bytes
+from utils.structured_output import is_unsupported_response_format
+
+
+# Rough number of prompt tokens for one image, used only for rate limiting.
+IMAGE_TOKENS = 765
+
+
+# Rough prompt token estimate of a chat request (about 4 characters per text token).
+def estimate_tokens(messages):
+    tokens = 0
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            tokens += len(content) // 4
+            continue
+        for part in content:
+            if part["type"] == "text":
+                tokens += len(part["text"]) // 4
+            else:
+                tokens += IMAGE_TOKENS
+    return tokens
+
+
+# Token-bucket limiter for requests per minute and tokens per minute. Either limit may be None.
+class RateLimiter:
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.limits = {'requests': requests_per_minute, 'tokens': tokens_per_minute}
+        self.available = {name: limit for name, limit in self.limits.items() if limit}
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated
+        self.updated = now
+        for name in self.available:
+            limit = self.limits[name]
+            self.available[name] = min(limit, self.available[name] + elapsed * limit / 60)
+
+    async def acquire(self, tokens=0):
+        cost = {'requests': 1, 'tokens': tokens}
+        async with self.lock:
+            while True:
+                self._refill()
+                # A single request larger than the whole bucket waits for a full bucket instead of forever.
+                needed = {name: min(cost[name], self.limits[name]) for name in self.available}
+                wait = max([(needed[name] - self.available[name]) * 60 / self.limits[name]
+                            for name in self.available] + [0])
+                if wait <= 0:
+                    for name in self.available:
+                        self.available[name] -= needed[name]
+                    return
+                await asyncio.sleep(wait)
+
+
+class AsyncEvaluator:
+    def __init__(self, client, model, concurrency=8, rate_limiter=None, retry_policy=None, response_cache=None,
+                 prepare_workers=2, prepared_videos=2, request_params=None):
+        # `client` is an openai.AsyncOpenAI instance, preferably created with max_retries=0 so that
+        # retries are handled here without holding a concurrency slot.
+        self.client = client
+        self.model = model
+        self.concurrency = concurrency
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.response_cache = response_cache
+        self.dead_letters = []
+        self.prepare_workers = prepare_workers
+        self.prepared_videos = prepared_videos
+        self.request_params = dict(request_params or {})
+
+    # Evaluate all questions of `groups`, a list of (video_id, positions) as made by group_by_video.
+    # prepare(video_id) -> frames runs in the thread pool, make_messages(position, frames) builds the
+    # request and on_result(position, output, error, info) receives every answer (or the final error once
+    # the row is given up on), with info holding latency (of the last attempt), elapsed (since the first
+    # attempt, including failed attempts and backoff waits), token usage, payload size and the number of attempts.
+    # release(video_id) is called once all questions of a video are done. row_label(position), if given, is the
+    # label under which a position is logged (e.g. its row in the questions table).
+    def run(self, groups, prepare, make_messages, on_result, release=None, row_label=None):
+        return asyncio.run(self.run_async(groups, prepare, make_messages, on_result, release, row_label))
+
+    async def run_async(self, groups, prepare, make_messages, on_result, release=None, row_label=None):
+        self.row_label = row_label if row_label is not None else (lambda position: position)
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Queue(maxsize=self.prepared_videos)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        with ThreadPoolExecutor(max_workers=self.prepare_workers) as executor:
+            # Producer: prepare frames ahead of the API calls, but never more than `prepared_videos` videos.
+            async def produce():
+                futures = [(video_id, positions, loop.run_in_executor(executor, prepare, video_id))
+                           for video_id, positions in groups[:self.prepare_workers]]
+                next_group = len(futures)
+                while futures:
+                    video_id, positions, future = futures.pop(0)
+                    try:
+                        frames, error = await future, None
+                    except Exception as e:
+                        frames, error = None, e
+                    if next_group < len(groups):
+                        next_video_id, next_positions = groups[next_group]
+                        futures.append((next_video_id, next_positions,
+                                        loop.run_in_executor(executor, prepare, next_video_id)))
+                        next_group += 1
+                    await ready.put((video_id, positions, frames, error))
+                await ready.put(None)
+
+            producer = asyncio.create_task(produce())
+            tasks = set()
+            while True:
+                item = await ready.get()
+                if item is None:
+                    break
+                video_id, positions, frames, error = item
+
+                if error is not None:
+                    print(f"Failed to prepare video {video_id}: {error}")
+                    for position in positions:
+                        self._dead_letter(position, error, 0)
+                        on_result(position, None, error, {'attempts': 0})
+                    self._release(release, video_id)
+                    continue
+
+                remaining = {'count': len(positions)}
+                for position in positions:
+                    # Acquire before creating the task, so at most `concurrency` calls are in flight at any time.
+                    await semaphore.acquire()
+                    task = asyncio.create_task(
+                        self._ask(position, frames, make_messages, on_result, semaphore,
+                                  video_id, remaining, release))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                del frames
+
+            await producer
+            if tasks:
+                await asyncio.gather(*tasks)
+
+    async def _ask(self, position, frames, make_messages, on_result, semaphore, video_id, remaining, release):
+        # The dispatcher acquired the semaphore for the first attempt.
+        holding = True
+        try:
+            messages = make_messages(position, frames)
+            size = payload_bytes(messages)
+            attempt = 0
+            info = {'payload_bytes': size}
+
+            if self.response_cache is not None:
+                cached = self.response_cache.get(self.model, messages, self.request_params)
+                if cached is not None:
+                    info = dict(info, attempts=0, cached=True, **(cached['usage'] or {}))
+                    on_result(position, cached['output'], None, info)
+                    return
+            first = time.perf_counter()
+            while True:
+                attempt += 1
+                try:
+                    if self.rate_limiter is not None:
+                        await self.rate_limiter.acquire(estimate_tokens(messages))
+                    params = self.request_params
+                    start = time.perf_counter()
+                    result = await self.client.chat.completions.create(model=self.model, messages=messages,
+                                                                       **params)
+                    end = time.perf_counter()
+                    info = {'latency': end - start, 'elapsed': end - first, 'attempts': attempt,
+                            'payload_bytes': size}
+                    if result.usage is not None:
+                        info['prompt_tokens'] = result.usage.prompt_tokens
+                        info['completion_tokens'] = result.usage.completion_tokens
+                    content = result.choices[0].message.content
+                    if content is None:
+                        raise EmptyResponseError('finish_reason: %s' % result.choices[0].finish_reason)
+                    if self.response_cache is not None:
+                        usage = {name: info[name] for name in ('prompt_tokens', 'completion_tokens') if name in info}
+                        self.response_cache.put(self.model, messages, content, usage, params)
+                    on_result(position, content, None, info)
+                    return
+                except Exception as e:
+                    if 'response_format' in params and is_unsupported_response_format(e):
+                        # Fall back to the prompt alone; this attempt does not count against the budget.
+                        if 'response_format' in self.request_params:
+                            print('The endpoint does not support response_format, sending requests without it.')
+                            self.request_params = {name: value for name, value in self.request_params.items()
+                                                   if name != 'response_format'}
+                        attempt -= 1
+                        continue
+                    delay = self.retry_policy.next_delay(e, attempt)
+                    if delay is None:
+                        self._dead_letter(position, e, attempt)
+                        on_result(position, None, e,
+                                  dict(info, attempts=attempt, elapsed=time.perf_counter() - first))
+                        return
+                    print('Index %s: %s error, retrying in %.1f s (attempt %d/%d)'
+                          % (self.row_label(position), classify_error(e), delay, attempt,
+                             self.retry_policy.max_attempts))
+
+                # Wait for the next attempt without holding a slot, so other rows are not stalled.
+                semaphore.release()
+                holding = False
+                await asyncio.sleep(delay)
+                await semaphore.acquire()
+                holding = True
+        except Exception as e:
+            # make_messages failed; there is nothing to retry.
+            self._dead_letter(position, e, 0)
+            on_result(position, None, e, {'attempts': 0})
+        finally:
+            if holding:
+                semaphore.release()
+            remaining['count'] -= 1
+            if remaining['count'] == 0:
+                self._release(release, video_id)
+
+    # A failing release (e.g. of a video that could not be read) must not end the whole run.
+    @staticmethod
+    def _release(release, video_id):
+        if release is None:
+            return
+        try:
+            release(video_id)
+        except Exception as e:
+            print(f"Failed to release video {video_id}: {e}")
+
+    def _dead_letter(self, position, error, attempts):
+        self.dead_letters.append({
+            'position': position,
+            'error_class': classify_error(error),
+            'error': str(error),
+            'attempts': attempts
+        })
@@ -0,0 +1,79 @@
+# Bootstrap confidence intervals and paired significance tests for accuracies.
+# All resamples are drawn at once as an (n_resamples, n) index matrix from a seeded generator, and the
+# resampled accuracies are computed with one vectorized mean per matrix (split into chunks for very large
+# inputs), so thousands of resamples cost a few NumPy operations instead of a Python loop.
+import numpy as np
+import pandas as pd
+
+
+# Upper bound on the number of elements of one resampling matrix.
+MAX_MATRIX_SIZE = 20_000_000
+
+
+# Accuracies of `n_resamples` bootstrap resamples of each row of `values` ((k, n) array of 0/1 outcomes).
+# Every row is resampled with the same indices, which is what makes paired comparisons paired.
+def resampled_means(values, n_resamples=2000, seed=0):
+    values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+    n = values.shape[1]
+    rng = np.random.default_rng(seed)
+    chunk = max(1, MAX_MATRIX_SIZE // max(n * len(values), 1))
+    means = []
+    for start in range(0, n_resamples, chunk):
+        indices = rng.integers(0, n, size=(min(chunk, n_resamples - start), n))
+        means.append(values[:, indices].mean(axis=2))
+    return np.concatenate(means, axis=1)
+
+
+# Percentile bootstrap confidence interval of the accuracy of 0/1 outcomes.
+def bootstrap_ci(correct, n_resamples=2000, alpha=0.05, seed=0):
+    correct = np.asarray(correct, dtype=np.float64)
+    if len(correct) == 0:
+        return np.nan, np.nan
+    means = resampled_means(correct, n_resamples, seed)[0]
+    low, high = np.quantile(means, [alpha / 2, 1 - alpha / 2])
+    return float(low), float(high)
+
+
+# Difference of accuracy (a - b) on the same questions, with its bootstrap CI and a two-sided p-value for
+# the null hypothesis of no difference.
+def paired_test(correct_a, correct_b, n_resamples=2000, alpha=0.05, seed=0):
+    correct_a = np.asarray(correct_a, dtype=np.float64)
+    correct_b = np.asarray(correct_b, dtype=np.float64)
+    if len(correct_a) == 0:
+        return {'diff': np.nan, 'ci_low': np.nan, 'ci_high': np.nan, 'p_value': np.nan}
+    diffs = resampled_means(correct_a - correct_b, n_resamples, seed)[0]
+    observed = correct_a.mean() - correct_b.mean()
+    low, high = np.quantile(diffs, [alpha / 2, 1 - alpha / 2])
+    # Share of resamples on the other side of zero, doubled for a two-sided test.
+    if observed >= 0:
+        p_value = min(1.0, 2 * np.mean(diffs <= 0))
+    else:
+        p_value = min(1.0, 2 * np.mean(diffs >= 0))
+    return {'diff': float(observed), 'ci_low': float(low), 'ci_high': float(high), 'p_value': float(p_value)}
+
+
+# CI columns for eval.py's per-category report of `model` (see utils/scoring.category_report).
+def category_cis(df, model, categories, n_resamples=2000, alpha=0.05, seed=0):
+    df = df[df['model'] == model]
+    bounds = []
+    for category in categories:
+        group = df if category == 'Total' else df[df['question_category'] == category]
+        bounds.append(bootstrap_ci(group['correct'].to_numpy(), n_resamples, alpha, seed))
+    return pd.DataFrame(bounds, columns=['CI_low', 'CI_high'])
+
+
+# Paired tests of every pair of models, per category and in total, on the questions both models answered.
+def paired_tests(df, n_resamples=2000, alpha=0.05, seed=0):
+    wide = df.pivot_table(index='row', columns='model', values='correct', aggfunc='first')
+    categories = df.drop_duplicates('row').set_index('row')['question_category'].reindex(wide.index)
+    models = list(wide.columns)
+    results = []
+    for i, model_a in enumerate(models):
+        for model_b in models[i + 1:]:
+            both = wide[[model_a, model_b]].dropna()
+            for category in sorted(categories.loc[both.index].unique()) + ['Total']:
+                pair = both if category == 'Total' else both[categories.loc[both.index] == category]
+                test = paired_test(pair[model_a].astype(float), pair[model_b].astype(float), n_resamples, alpha,
+                                   seed)
+                results.append(dict(model_a=model_a, model_b=model_b, category=category, num=len(pair), **test))
+    return pd.DataFrame(results)
@@ -0,0 +1,79 @@
+# Shared, long-lived API clients for the evaluation (run.py) and generation (question_generation/) scripts.
+# One pooled client is kept per backend and configuration instead of creating clients per call: connections
+# are kept alive and reused across requests, the pool is sized for the number of concurrent requests, HTTP/2
+# is used when the `h2` package is installed, and every request gets connect/read/write/pool timeouts.
+import threading
+
+import httpx
+
+
+# Defaults of the connection pool and timeouts (in seconds).
+MAX_CONNECTIONS = 64
+KEEPALIVE_EXPIRY = 60.0
+CONNECT_TIMEOUT = 10.0
+REQUEST_TIMEOUT = 120.0
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def http2_available():
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def http_limits(max_connections=MAX_CONNECTIONS, keepalive_expiry=KEEPALIVE_EXPIRY):
+    return httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections,
+                        keepalive_expiry=keepalive_expiry)
+
+
+# Timeout of every request: `timeout` for reading the response (and for the whole request by default),
+# `connect_timeout` for opening a connection.
+def http_timeout(timeout=REQUEST_TIMEOUT, connect_timeout=CONNECT_TIMEOUT):
+    return httpx.Timeout(timeout, connect=connect_timeout)
+
+
+def _shared(key, create):
+    with _lock:
+        if key not in _clients:
+            _clients[key] = create()
+        return _clients[key]
+
+
+# AsyncOpenAI client for `base_url`, shared by all callers with the same settings. Retries are left to the
+# caller (see utils/retry.py) unless `max_retries` is given.
+def openai_client(api_key, base_url=None, max_connections=MAX_CONNECTIONS, timeout=REQUEST_TIMEOUT,
+                  connect_timeout=CONNECT_TIMEOUT, http2=True, max_retries=0):
+    import openai
+
+    def create():
+        http_client = openai.DefaultAsyncHttpxClient(
+            limits=http_limits(max_connections),
+            timeout=http_timeout(timeout, connect_timeout),
+            http2=http2 and http2_available()
+        )
+        return openai.AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=max_retries,
+                                  timeout=http_timeout(timeout, connect_timeout), http_client=http_client)
+
+    key = ('openai', api_key, base_url, max_connections, timeout, connect_timeout, http2, max_retries)
+    return _shared(key, create)
+
+
+# Gemini model object, created once per model name (the API key is configured on first use).
+def gemini_model(model_name, api_key=None):
+    import google.generativeai as genai
+
+    def create():
+        if api_key is not None:
+            genai.configure(api_key=api_key)
+        return genai.GenerativeModel(model_name=model_name)
+
+    return _shared(('gemini', model_name, api_key), create)
+
+
+# request_options of a Gemini call with the shared timeout.
+def gemini_request_options(timeout=REQUEST_TIMEOUT):
+    return {'timeout': timeout}
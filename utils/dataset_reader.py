@@ -0,0 +1,85 @@
+# Streaming reader for MCQ.parquet.
+# The question table is read row group by row group with pyarrow, projecting only the columns that are
+# needed (e.g. `video_id` and `question` for run.py). Optional category / video filters are checked against
+# the row-group statistics first, so row groups without any matching row are never read, and then applied
+# to each batch. The original DataFrame index is restored for every batch, so results can still be keyed by
+# the row index of the full table.
+import json
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+
+# Reconstruct the pandas index of a row group from the pandas metadata stored in the parquet file.
+def _index_info(parquet_file):
+    metadata = parquet_file.schema_arrow.metadata or {}
+    pandas_metadata = json.loads(metadata.get(b'pandas', b'{}'))
+    index_columns = pandas_metadata.get('index_columns', [])
+    if len(index_columns) == 1:
+        return index_columns[0]
+    # No or a multi-level index: fall back to row positions.
+    return {'kind': 'range', 'start': 0, 'step': 1}
+
+
+# Whether the row-group statistics of `column` rule out every value in `values`.
+def _excluded_by_statistics(row_group, column_index, values):
+    statistics = row_group.column(column_index).statistics
+    if statistics is None or not statistics.has_min_max:
+        return False
+    try:
+        return all(value < statistics.min or value > statistics.max for value in values)
+    except TypeError:
+        # Values of a different type than the column (e.g. numeric video ids) cannot be pruned.
+        return False
+
+
+# Yield DataFrames of the questions, one per row group, restricted to `columns` (None for all columns)
+# and to the rows whose `question_category` is in `categories` and whose `video_id` is in `video_ids`.
+def iter_batches(path, columns=None, categories=None, video_ids=None):
+    parquet_file = pq.ParquetFile(path)
+    names = parquet_file.schema_arrow.names
+    index = _index_info(parquet_file)
+    index_column = index if isinstance(index, str) else None
+
+    filters = {}
+    if categories is not None:
+        filters['question_category'] = set(categories)
+    if video_ids is not None:
+        filters['video_id'] = set(str(video_id) for video_id in video_ids)
+
+    if columns is None:
+        columns = [name for name in names if name != index_column]
+    read_columns = list(dict.fromkeys(list(columns) + list(filters) + ([index_column] if index_column else [])))
+
+    offset = 0
+    for i in range(parquet_file.num_row_groups):
+        row_group = parquet_file.metadata.row_group(i)
+        num_rows = row_group.num_rows
+        start, offset = offset, offset + num_rows
+        if any(_excluded_by_statistics(row_group, names.index(column), values)
+               for column, values in filters.items()):
+            continue
+
+        batch = parquet_file.read_row_group(i, columns=read_columns).to_pandas(ignore_metadata=True)
+        if index_column is not None:
+            # pandas stores an unnamed index as '__index_level_0__'.
+            name = None if index_column.startswith('__index_level_') else index_column
+            batch.index = pd.Index(batch.pop(index_column).to_numpy(), name=name)
+        else:
+            batch.index = index['start'] + index['step'] * np.arange(start, start + num_rows)
+
+        mask = np.ones(len(batch), dtype=bool)
+        for column, values in filters.items():
+            mask &= batch[column].astype(str).isin(values).to_numpy()
+        batch = batch.loc[mask, list(columns)]
+        if len(batch) > 0:
+            yield batch
+
+
+# Read the (projected and filtered) question table into one DataFrame.
+def read_questions(path, columns=None, categories=None, video_ids=None):
+    batches = list(iter_batches(path, columns, categories, video_ids))
+    if not batches:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(batches)
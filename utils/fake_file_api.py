@@ -0,0 +1,75 @@
+# Local fake of the Gemini file API (upload_file / get_file / delete_file / list_files), for trying out the
+# upload registry and the remote storage manager without network access or quota. Files stay in the
+# PROCESSING state for `processing_time` seconds after their upload and expire after `ttl` seconds.
+import datetime
+import itertools
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+
+class FakeFile:
+    def __init__(self, api, name, path):
+        self.api = api
+        self.name = name
+        self.uri = 'https://fake.invalid/' + name
+        self.display_name = os.path.basename(path)
+        self.size_bytes = os.path.getsize(path)
+        self.created = time.time()
+        self.expiration_time = datetime.datetime.fromtimestamp(self.created + api.ttl, datetime.timezone.utc)
+
+    @property
+    def state(self):
+        if self.api.fail and self.display_name in self.api.fail:
+            return SimpleNamespace(name='FAILED')
+        if time.time() - self.created < self.api.processing_time:
+            return SimpleNamespace(name='PROCESSING')
+        return SimpleNamespace(name='ACTIVE')
+
+    def delete(self):
+        self.api.delete_file(self.name)
+
+
+class FakeFileAPI:
+    def __init__(self, upload_time=0.0, processing_time=0.0, ttl=48 * 3600, fail=None):
+        self.upload_time = upload_time
+        self.processing_time = processing_time
+        self.ttl = ttl
+        # Display names of the files whose processing fails.
+        self.fail = set(fail or [])
+        self.files = {}
+        self.ids = itertools.count()
+        self.stats = {'uploads': 0, 'deletes': 0, 'get_file': 0}
+        self.lock = threading.Lock()
+
+    def upload_file(self, path, **kwargs):
+        time.sleep(self.upload_time)
+        with self.lock:
+            file = FakeFile(self, 'files/fake-%d' % next(self.ids), path)
+            self.files[file.name] = file
+            self.stats['uploads'] += 1
+        return file
+
+    def get_file(self, name):
+        with self.lock:
+            self.stats['get_file'] += 1
+            file = self.files.get(name)
+        if file is None or time.time() - file.created > self.ttl:
+            raise KeyError('File %s not found.' % name)
+        return file
+
+    def delete_file(self, name):
+        name = getattr(name, 'name', name)
+        with self.lock:
+            if self.files.pop(name, None) is None:
+                raise KeyError('File %s not found.' % name)
+            self.stats['deletes'] += 1
+
+    def list_files(self):
+        with self.lock:
+            return list(self.files.values())
+
+    def stored_bytes(self):
+        with self.lock:
+            return sum(file.size_bytes for file in self.files.values())
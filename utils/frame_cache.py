@@ -0,0 +1,122 @@
+# Per-video cache of sampled, already-encoded frames.
+# Many questions in MCQ.parquet point to the same video, so the sampled base64 frames are kept in an
+# in-memory LRU for the videos in use right now, backed by an on-disk cache that survives across runs.
+# Disk entries are content-addressed by (video path, mtime, selection strategy, sample count, resize, format,
+# quality, payload budget), so changing any sampling option or replacing the video file produces a new entry instead of
+# stale frames.
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from utils.frame_sampler import sample_video
+
+
+# Bump this when the on-disk layout or the sampling logic changes, to invalidate old entries.
+CACHE_VERSION = 5
+
+
+class FrameCache:
+    def __init__(self, cache_dir='cache/frames', max_videos=4, max_frames=32, max_side=None, image_format='jpeg',
+                 quality=None, workers=4, budget=None, strategy='every_nth'):
+        # `cache_dir=None` keeps the cache in memory only.
+        self.cache_dir = cache_dir
+        self.max_videos = max_videos
+        self.max_frames = max_frames
+        self.max_side = max_side
+        self.image_format = image_format
+        self.quality = quality
+        self.workers = workers
+        self.budget = budget
+        self.strategy = strategy
+        self.memory = OrderedDict()
+        # Cache key of each video path seen by `get`, so `release` does not need the video file.
+        self.keys = {}
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+        # Total wall time per preprocessing stage (open, select, decode, resize, encode) over all misses.
+        self.timings = {}
+        # Frames may be prepared from several worker threads at once.
+        self.lock = threading.Lock()
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, video_path):
+        video_path = os.path.abspath(video_path)
+        fields = [CACHE_VERSION, video_path, os.stat(video_path).st_mtime_ns, self.strategy,
+                  self.max_frames, self.max_side, self.image_format, self.quality,
+                  None if self.budget is None else self.budget.key()]
+        return hashlib.sha1(json.dumps(fields).encode('utf-8')).hexdigest()
+
+    # `timings`, if given, receives where the frames came from ('source') and, on a miss, the wall time of
+    # each preprocessing stage.
+    def get(self, video_path, timings=None):
+        key = self.key(video_path)
+        with self.lock:
+            self.keys[os.path.abspath(video_path)] = key
+        if timings is None:
+            timings = {}
+
+        # Videos in use right now.
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                timings['source'] = 'memory'
+                return self.memory[key]
+
+        # Videos sampled in an earlier run (or earlier in this one and evicted since).
+        frames = self._load(key)
+        if frames is not None:
+            stat = 'disk_hits'
+            timings['source'] = 'disk'
+        else:
+            stat = 'misses'
+            frames = sample_video(video_path, self.max_frames, self.max_side, self.image_format, self.quality,
+                                  self.workers, timings, self.budget, self.strategy)
+            self._store(key, video_path, frames)
+            timings['source'] = 'decoded'
+
+        with self.lock:
+            self.stats[stat] += 1
+            if stat == 'misses':
+                for name, elapsed in timings.items():
+                    if name == 'source':
+                        continue
+                    self.timings[name] = self.timings.get(name, 0.0) + elapsed
+            self.memory[key] = frames
+            while len(self.memory) > self.max_videos:
+                self.memory.popitem(last=False)
+        return frames
+
+    # Drop a video from memory once all of its questions are done. The disk entry is kept.
+    def release(self, video_path):
+        with self.lock:
+            key = self.keys.pop(os.path.abspath(video_path), None)
+            if key is not None:
+                self.memory.pop(key, None)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.json')
+
+    def _load(self, key):
+        if self.cache_dir is None or not os.path.exists(self._path(key)):
+            return None
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as file:
+                return json.load(file)['frames']
+        except (ValueError, KeyError):
+            # A broken entry is treated as a miss and rewritten.
+            return None
+
+    def _store(self, key, video_path, frames):
+        if self.cache_dir is None:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so that a killed process never leaves a half-written entry.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            json.dump({'video_path': os.path.abspath(video_path), 'frames': frames}, file)
+        os.replace(tmp_path, path)
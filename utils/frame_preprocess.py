@@ -0,0 +1,108 @@
+# Preprocessing of the sampled frames before they are sent to the model.
+# The selected frames (all of the same size) are resized to a configurable max side, with the target size
+# computed once for the whole batch, and encoded (JPEG or WebP) in a thread pool. cv2 releases
+# the GIL in both resize and imencode, so the workers run in parallel. Wall time of every stage is added
+# to an optional `timings` dict.
+#
+# Running this file directly compares sequential and pooled preprocessing on the frames of a video:
+#   python -m utils.frame_preprocess dataset/videos/xxx.mp4 --max-side 768
+import base64
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import cv2
+
+
+IMAGE_FORMATS = {
+    'jpeg': ('.jpg', 'image/jpeg', cv2.IMWRITE_JPEG_QUALITY),
+    'webp': ('.webp', 'image/webp', cv2.IMWRITE_WEBP_QUALITY),
+}
+
+# Shared by all preprocessing calls; encoding threads are cheap to keep around.
+_executors = {}
+
+
+def get_executor(workers):
+    if workers not in _executors:
+        _executors[workers] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='frame-encode')
+    return _executors[workers]
+
+
+def mime_type(image_format):
+    return IMAGE_FORMATS[image_format][1]
+
+
+# Accumulate the wall time of a stage into `timings` (if given).
+@contextmanager
+def stage(timings, name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+# Size (width, height) with the longer side at most `max_side`, or None if no resize is needed.
+def target_size(height, width, max_side=None):
+    if not max_side or max(height, width) <= max_side:
+        return None
+    scale = max_side / max(height, width)
+    return round(width * scale), round(height * scale)
+
+
+def encode_image(image, image_format='jpeg', quality=None):
+    extension, _, quality_flag = IMAGE_FORMATS[image_format]
+    params = [] if quality is None else [int(quality_flag), int(quality)]
+    success, buffer = cv2.imencode(extension, image, params)
+    if not success:
+        raise ValueError('Failed to encode frame as %s' % image_format)
+    return base64.b64encode(buffer).decode("utf-8")
+
+
+# Resize and encode a batch of frames, returning base64 strings in the original order.
+def preprocess_frames(frames, max_side=None, image_format='jpeg', quality=None, workers=4, timings=None):
+    if len(frames) == 0:
+        return []
+
+    executor = get_executor(workers)
+    size = target_size(frames[0].shape[0], frames[0].shape[1], max_side)
+    if size is not None:
+        # A single cv2.resize over the channel-stacked batch is slower than resizing frame by frame, so the
+        # frames are resized one by one, in parallel.
+        with stage(timings, 'resize'):
+            frames = list(executor.map(lambda frame: cv2.resize(frame, size, interpolation=cv2.INTER_AREA),
+                                       frames))
+
+    with stage(timings, 'encode'):
+        return list(executor.map(lambda frame: encode_image(frame, image_format, quality), frames))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from utils.frame_sampler import read_frames_at
+    from utils.frame_selection import sample_frame_indices
+
+    parser = argparse.ArgumentParser(description='Benchmark pooled frame preprocessing.')
+    parser.add_argument('video')
+    parser.add_argument('--max-frames', type=int, default=32)
+    parser.add_argument('--max-side', type=int, default=None)
+    parser.add_argument('--format', choices=sorted(IMAGE_FORMATS), default='jpeg')
+    parser.add_argument('--quality', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    video = cv2.VideoCapture(args.video)
+    frames = read_frames_at(video, sample_frame_indices(int(video.get(cv2.CAP_PROP_FRAME_COUNT)), args.max_frames))
+    video.release()
+
+    for workers in sorted({1, args.workers}):
+        timings = {}
+        start = time.perf_counter()
+        encoded = preprocess_frames(frames, args.max_side, args.format, args.quality, workers, timings)
+        elapsed = time.perf_counter() - start
+        print('%d worker(s): %.3f s, %d frames, %.1f KB payload  %s'
+              % (workers, elapsed, len(encoded), sum(len(frame) for frame in encoded) / 1024,
+                 ', '.join('%s %.3f s' % item for item in timings.items())))
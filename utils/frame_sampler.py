@@ -0,0 +1,132 @@
+# Sparse frame sampling for the benchmark videos.
+# Instead of decoding and encoding every frame of a video and then throwing most of them away,
+# the target frame indices are computed first from CAP_PROP_FRAME_COUNT (see utils/frame_selection.py for
+# the selection strategies) and only those frames are grabbed (short gaps) or seeked to (long gaps).
+# Only the selected frames are ever JPEG/base64 encoded.
+#
+# Running this file directly benchmarks the sparse sampler against the old decode-everything path:
+#   python -m utils.frame_sampler dataset/videos/xxx.mp4 [more videos ...]
+import cv2
+import base64
+import math
+import time
+
+from utils.frame_preprocess import preprocess_frames, stage
+from utils.payload_budget import fit_to_budget
+from utils.frame_selection import select_frame_indices
+
+
+# Gaps longer than this many frames are skipped with a seek instead of grabbing frame by frame.
+# Seeking jumps to the previous keyframe and decodes forward, which only pays off for long gaps.
+SEEK_THRESHOLD = 48
+
+
+# Read only the frames at the given (sorted) indices from an opened cv2.VideoCapture.
+def read_frames_at(video, indices, seek_threshold=SEEK_THRESHOLD):
+    frames = []
+    position = 0  # Index of the next frame the decoder will return.
+    for target in indices:
+        gap = target - position
+        if gap > seek_threshold:
+            video.set(cv2.CAP_PROP_POS_FRAMES, target)
+            position = target
+        else:
+            # Skip intermediate frames without converting them to images.
+            while position < target:
+                if not video.grab():
+                    return frames
+                position += 1
+
+        if not video.grab():
+            break
+        success, frame = video.retrieve()
+        position += 1
+        if not success:
+            break
+        frames.append(frame)
+    return frames
+
+
+# Encode frames as JPEG images and convert them to base64 strings, one by one.
+def encode_frames(frames):
+    base64Frames = []
+    for frame in frames:
+        _, buffer = cv2.imencode(".jpg", frame)
+        base64Frames.append(base64.b64encode(buffer).decode("utf-8"))
+    return base64Frames
+
+
+# Decode every frame of the video, mirroring the original loop in run.py.
+# Used as a fallback when the container does not report a frame count, and as the benchmark baseline.
+def decode_all_frames(video_path):
+    video = cv2.VideoCapture(video_path)
+    frames = []
+    while video.isOpened():
+        success, frame = video.read()
+        if not success:
+            break
+        frames.append(frame)
+    video.release()
+    return frames
+
+
+# Open a video, pick the target frames and return them as base64 encoded images.
+# Resizing and encoding are done by preprocess_frames; per-stage wall times are added to `timings`.
+# With a PayloadBudget, quality, resolution and frame count are lowered until the frames fit the budget.
+def sample_video(video_path, max_frames=32, max_side=None, image_format='jpeg', quality=None, workers=4,
+                 timings=None, budget=None, strategy='every_nth', seek_threshold=SEEK_THRESHOLD):
+    with stage(timings, 'open'):
+        video = cv2.VideoCapture(video_path)
+        frame_count = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    if frame_count > 0:
+        with stage(timings, 'select'):
+            indices = select_frame_indices(video_path, frame_count, max_frames, strategy)
+        with stage(timings, 'decode'):
+            frames = read_frames_at(video, indices, seek_threshold)
+            video.release()
+    else:
+        # Some containers do not report the number of frames, so fall back to decoding everything.
+        video.release()
+        with stage(timings, 'decode'):
+            frames = decode_all_frames(video_path)
+        with stage(timings, 'select'):
+            indices = select_frame_indices(video_path, len(frames), max_frames, strategy)
+        frames = [frames[i] for i in indices]
+
+    if budget is not None:
+        encoded, _ = fit_to_budget(frames, budget, max_side, image_format, quality, workers, timings)
+        return encoded
+    return preprocess_frames(frames, max_side, image_format, quality, workers, timings)
+
+
+# The original run.py path: decode and encode every frame, then keep every nth one.
+def sample_video_decode_all(video_path, max_frames=32):
+    base64Frames = encode_frames(decode_all_frames(video_path))
+    div_num = math.ceil(len(base64Frames) / max_frames)
+    return base64Frames[0::div_num]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark sparse frame sampling against decoding every frame.')
+    parser.add_argument('videos', nargs='+', help='Video files to sample.')
+    parser.add_argument('--max-frames', type=int, default=32)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    for video_path in args.videos:
+        timings = {}
+        for name, sampler in [('decode_all', sample_video_decode_all), ('sparse', sample_video)]:
+            best = float('inf')
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                frames = sampler(video_path, args.max_frames)
+                best = min(best, time.perf_counter() - start)
+            timings[name] = (best, len(frames))
+
+        print(video_path)
+        for name, (elapsed, num_frames) in timings.items():
+            print('  %-10s %8.3f s  %3d frames' % (name, elapsed, num_frames))
+        print('  speedup    %8.1fx' % (timings['decode_all'][0] / timings['sparse'][0]))
@@ -0,0 +1,145 @@
+# Frame selection strategies.
+# - every_nth: every ceil(n / K)-th frame, the original selection of run.py (often fewer than K frames).
+# - uniform:   exactly K frames evenly spread over the video.
+# - scene:     the first frame plus, in each of K - 1 equal segments of the video, the strongest scene change
+#              (histogram difference between consecutive analysis frames), or the middle of the segment if
+#              nothing in it changes; every part of the video stays covered.
+# - motion:    K frames at equal steps of accumulated motion (mean absolute difference of consecutive
+#              frames), so long hovering stretches get few frames and fast maneuvers get many.
+# The content-aware strategies analyze cheap downscaled grayscale copies of every `stride`-th frame; all
+# scoring is vectorized with NumPy.
+#
+# Running this file directly benchmarks the selection cost of every strategy:
+#   python -m utils.frame_selection dataset/videos/xxx.mp4 [more videos ...] --k 32
+import math
+import time
+
+import cv2
+import numpy as np
+
+from utils.payload_budget import evenly_spaced
+
+
+# Size of the grayscale frames used for content analysis.
+ANALYSIS_SIZE = (64, 36)
+
+# Histogram difference (L1, between 0 and 2) below which consecutive frames do not count as a scene change,
+# so compression noise of a hovering shot is not mistaken for one.
+MIN_SCENE_CHANGE = 0.05
+
+
+# Every nth frame, where n = ceil(frame_count / max_frames). This reproduces the indices selected by
+# the original `base64Frames[0::div_num]` in run.py, so the model receives exactly the same frames.
+def sample_frame_indices(frame_count, max_frames=32):
+    if frame_count <= 0:
+        return []
+    div_num = math.ceil(frame_count / max_frames)
+    return list(range(0, frame_count, div_num))
+
+
+# Downscaled grayscale copies of every `stride`-th frame. Returns (frame indices, (N, h, w) uint8 array).
+def analyze_video(video_path, stride=2, size=ANALYSIS_SIZE):
+    video = cv2.VideoCapture(video_path)
+    indices, frames = [], []
+    position = 0
+    while True:
+        if not video.grab():
+            break
+        if position % stride == 0:
+            success, frame = video.retrieve()
+            if not success:
+                break
+            small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+            frames.append(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY))
+            indices.append(position)
+        position += 1
+    video.release()
+    if not frames:
+        return np.array([], dtype=int), np.empty((0, size[1], size[0]), dtype=np.uint8)
+    return np.array(indices), np.stack(frames)
+
+
+# Position 0 plus one position in each of `k` - 1 equal segments of `scores` (one per analysis frame): the
+# highest score of the segment if it is above `min_score`, otherwise the middle of the segment.
+def segment_peaks(scores, k, min_score=0.0):
+    chosen = [0]
+    bounds = np.linspace(1, len(scores), k).round().astype(int)
+    for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+        if end <= start:
+            continue
+        best = start + int(np.argmax(scores[start:end]))
+        chosen.append(best if scores[best] > min_score else (start + end - 1) // 2)
+    return chosen
+
+
+# Add the uniform positions farthest from the already chosen ones until there are `k` positions out of `n`.
+def fill_uniform(chosen, n, k):
+    if len(chosen) >= k:
+        return chosen
+    candidates = np.array([position for position in evenly_spaced(n, k) if position not in chosen])
+    distance = np.abs(candidates[:, None] - np.array(chosen)[None, :]).min(axis=1)
+    return sorted(chosen + candidates[np.argsort(-distance, kind='stable')[:k - len(chosen)]].tolist())
+
+
+def select_scene(gray, k, bins=32):
+    if len(gray) <= k:
+        return list(range(len(gray)))
+    # Normalized intensity histograms of all frames at once.
+    offsets = np.arange(len(gray))[:, None] * bins
+    values = (gray.reshape(len(gray), -1).astype(np.int64) * bins // 256) + offsets
+    histograms = np.bincount(values.ravel(), minlength=len(gray) * bins).reshape(len(gray), bins)
+    histograms = histograms / histograms.sum(axis=1, keepdims=True)
+
+    scores = np.zeros(len(gray))
+    scores[1:] = np.abs(np.diff(histograms, axis=0)).sum(axis=1)
+    return segment_peaks(scores, k, min_score=MIN_SCENE_CHANGE)
+
+
+def select_motion(gray, k):
+    if len(gray) <= k:
+        return list(range(len(gray)))
+    motion = np.abs(np.diff(gray.astype(np.int16), axis=0)).mean(axis=(1, 2))
+    # Small floor so that completely static stretches still get a share of the frames.
+    motion = motion + max(motion.mean(), 1e-6) * 0.05
+    cumulative = np.concatenate([[0.0], np.cumsum(motion)])
+    targets = np.linspace(0, cumulative[-1], k)
+    positions = np.searchsorted(cumulative, targets, side='left').clip(0, len(gray) - 1)
+    # Bursts of motion can map several targets to the same frame; the duplicates are filled up uniformly.
+    return fill_uniform(sorted(set(positions.tolist())), len(gray), k)
+
+
+STRATEGIES = ['every_nth', 'uniform', 'scene', 'motion']
+
+
+# Frame indices of `video_path` to send to the model, chosen by `strategy`.
+def select_frame_indices(video_path, frame_count, k=32, strategy='every_nth', stride=2):
+    if strategy == 'every_nth':
+        return sample_frame_indices(frame_count, k)
+    if strategy == 'uniform':
+        return evenly_spaced(frame_count, k)
+    if strategy in ('scene', 'motion'):
+        indices, gray = analyze_video(video_path, stride)
+        positions = select_scene(gray, k) if strategy == 'scene' else select_motion(gray, k)
+        return indices[positions].tolist()
+    raise ValueError('Unknown frame selection strategy %r, expected one of %s' % (strategy, STRATEGIES))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark the selection cost of each frame selection strategy.')
+    parser.add_argument('videos', nargs='+')
+    parser.add_argument('--k', type=int, default=32)
+    parser.add_argument('--stride', type=int, default=2)
+    args = parser.parse_args()
+
+    for video_path in args.videos:
+        video = cv2.VideoCapture(video_path)
+        frame_count = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+        video.release()
+        print('%s (%d frames)' % (video_path, frame_count))
+        for strategy in STRATEGIES:
+            start = time.perf_counter()
+            indices = select_frame_indices(video_path, frame_count, args.k, strategy, args.stride)
+            elapsed = time.perf_counter() - start
+            print('  %-10s %8.3f s  %3d frames  %s' % (strategy, elapsed, len(indices), indices[:8]))
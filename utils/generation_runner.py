@@ -0,0 +1,114 @@
+# Concurrent runner for the MCQ generation scripts in question_generation/.
+# The category prompts of a video do not depend on each other, so they are sent through a bounded pool of
+# worker threads instead of one after the other with a fixed sleep in between. Several videos are in flight
+# at once (at most `max_videos`), and a requests-per-minute limiter replaces the sleeps. Results are handed
+# back to the main thread, which keeps writing the MCQ table on its own.
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Thread-safe token bucket for requests per minute (None for no limit). A caller that finds the bucket empty
+# reserves the next free slot and sleeps until then, so waiting callers are served in order.
+class ThreadRateLimiter:
+    def __init__(self, requests_per_minute=None):
+        self.limit = requests_per_minute
+        self.available = requests_per_minute or 0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if not self.limit:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.available = min(self.limit, self.available + (now - self.updated) * self.limit / 60)
+            self.updated = now
+            self.available -= 1
+            wait = -self.available * 60 / self.limit if self.available < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+class GenerationRunner:
+    def __init__(self, workers=4, requests_per_minute=None, max_videos=None):
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.limiter = ThreadRateLimiter(requests_per_minute)
+        self.results = queue.Queue()
+        self.videos = threading.Semaphore(max_videos or workers)
+        self.outstanding = 0
+
+    # Rate-limited generate_content call of a Gemini model; use it for every call made by prepare and ask.
+    def generate(self, model, contents, **kwargs):
+        self.limiter.acquire()
+        return model.generate_content(contents, **kwargs)
+
+    # Generate the questions of one video: prepare(video) runs first (e.g. to describe the video) and returns a
+    # context, then ask(video, context, category) runs for every category concurrently. Each outcome is
+    # delivered by `completed` / `drain` as (video, category, result, error); if prepare fails, its error is
+    # delivered for every category. done(video), if given, is called once the video is finished with (e.g. to
+    # release its remote file). Blocks while `max_videos` videos are already in flight.
+    def submit(self, video, categories, ask, prepare=None, done=None):
+        categories = list(categories)
+        if not categories:
+            if done is not None:
+                done(video)
+            return
+        self.videos.acquire()
+        self.outstanding += len(categories)
+        self.executor.submit(self._run_video, video, categories, ask, prepare, done)
+
+    def _finish_video(self, video, done):
+        if done is not None:
+            try:
+                done(video)
+            except Exception as e:
+                print('Error finishing video %s: %s' % (video, e))
+        self.videos.release()
+
+    def _run_video(self, video, categories, ask, prepare, done):
+        try:
+            context = prepare(video) if prepare is not None else None
+        except Exception as e:
+            self._finish_video(video, done)
+            for category in categories:
+                self.results.put((video, category, None, e))
+            return
+        remaining = {'count': len(categories)}
+        lock = threading.Lock()
+
+        def run_category(category):
+            try:
+                result, error = ask(video, context, category), None
+            except Exception as e:
+                result, error = None, e
+            with lock:
+                remaining['count'] -= 1
+                finished = remaining['count'] == 0
+            if finished:
+                self._finish_video(video, done)
+            self.results.put((video, category, result, error))
+
+        for category in categories:
+            self.executor.submit(run_category, category)
+
+    # Outcomes that are ready now, without waiting.
+    def completed(self):
+        while True:
+            try:
+                item = self.results.get_nowait()
+            except queue.Empty:
+                return
+            self.outstanding -= 1
+            yield item
+
+    # All remaining outcomes, waiting for the work in flight.
+    def drain(self):
+        while self.outstanding > 0:
+            item = self.results.get()
+            self.outstanding -= 1
+            yield item
+
+    def close(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,80 @@
+# Leaderboard over all model outputs in a result folder.
+# Every `*_output.csv` / `*_output.parquet` file is scored in a pool of worker processes, and the per-category
+# counts of each file are cached under the SHA-256 of its contents, so unchanged files are never scored
+# again. The counts are combined into one model x category accuracy table.
+import glob
+import hashlib
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from utils.scoring import accuracy_tables, model_name, score_frames
+
+
+# Bump this when the scoring rules change, so that cached scores are recomputed.
+SCORING_VERSION = 4
+
+
+# One result file per model; the Parquet copy written by run.py is preferred over the CSV.
+def find_result_files(folder):
+    files = {}
+    for pattern in ['*_output.csv', '*_output.parquet']:
+        for path in sorted(glob.glob(os.path.join(folder, pattern))):
+            files[model_name(path)] = path
+    return [files[model] for model in sorted(files)]
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Correct answers and number of scored questions per category of one result file.
+def score_file(path):
+    category = accuracy_tables(score_frames([path]))['category']
+    return [{'category': row.question_category, 'correct': int(row.Correct), 'num': int(row.Num)}
+            for row in category.itertuples()]
+
+
+def cached_score(path, cache_dir):
+    key = hashlib.sha256(('%d:%s' % (SCORING_VERSION, file_hash(path))).encode('utf-8')).hexdigest()
+    cache_path = os.path.join(cache_dir, key + '.json')
+    if os.path.exists(cache_path):
+        with open(cache_path, 'r', encoding='utf-8') as file:
+            return json.load(file), True
+    scores = score_file(path)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as file:
+        json.dump(scores, file)
+    os.replace(tmp_path, cache_path)
+    return scores, False
+
+
+# Model x category accuracy of all result files in `folder`, with 'Total' and 'Num' columns.
+def build_leaderboard(folder='result', cache_dir='cache/scores', workers=None):
+    os.makedirs(cache_dir, exist_ok=True)
+    paths = find_result_files(folder)
+    rows = []
+    hits = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for path, (scores, cached) in zip(paths, executor.map(cached_score, paths, [cache_dir] * len(paths))):
+            hits += cached
+            rows.extend(dict(score, model=model_name(path)) for score in scores)
+    print('Scored %d result files (%d from cache).' % (len(paths), hits))
+    if not rows:
+        return pd.DataFrame()
+
+    counts = pd.DataFrame(rows)
+    table = counts.pivot_table(index='model', columns='category', values='correct', aggfunc='sum') \
+        / counts.pivot_table(index='model', columns='category', values='num', aggfunc='sum')
+    totals = counts.groupby('model')[['correct', 'num']].sum()
+    table['Total'] = totals['correct'] / totals['num']
+    table['Num'] = totals['num']
+    table.columns.name = None
+    return table.sort_values('Total', ascending=False)
@@ -0,0 +1,80 @@
+# Append-only store of generated MCQs for the scripts in question_generation/.
+# Every generated question is appended as one JSON line with its row index, instead of concatenating it to
+# the whole table and rewriting the CSV / XLSX / JSON files after each question. Lines are flushed and
+# fsync'ed in batches, and a torn last line left by a killed process is ignored on reading. The CSV, XLSX and
+# JSON exports are written once at the end of a run, or on demand with
+#   python -m utils.mcq_sink path/to/MCQ.jsonl --xlsx --json
+import argparse
+import os
+
+import pandas as pd
+
+from utils.result_journal import JsonLinesWriter, read_journal
+
+
+class MCQSink(JsonLinesWriter):
+    def __init__(self, path, flush_every=16, flush_interval=5.0):
+        # New rows continue the index of the rows already stored.
+        rows = read_journal(path)
+        self.next_index = max((row['index'] for row in rows), default=-1) + 1
+        super().__init__(path, flush_every, flush_interval)
+
+    def append(self, entry):
+        index = self.next_index
+        self.next_index += 1
+        self.write(dict(entry, index=index))
+        return index
+
+
+# The stored MCQs as a table indexed like the CSV written by the generation scripts. `columns` come first, in
+# that order (empty if missing from the rows), followed by any other fields of the rows.
+def read_mcqs(path, columns=None):
+    rows = read_journal(path)
+    df = pd.DataFrame(rows)
+    if len(df) == 0:
+        return pd.DataFrame(columns=columns)
+    df = df.set_index('index')
+    df.index.name = None
+    if columns is None:
+        return df
+    return df.reindex(columns=list(columns) + [name for name in df.columns if name not in columns])
+
+
+# Seed a new sink from an MCQ CSV written by an older version of the generation scripts.
+def import_csv(csv_path, sink):
+    df = pd.read_csv(csv_path, index_col=0)
+    for index, row in df.iterrows():
+        entry = {name: (None if pd.isna(value) else value) for name, value in row.items()}
+        sink.write(dict(entry, index=int(index)))
+    sink.next_index = max(sink.next_index, int(df.index.max()) + 1 if len(df) else 0)
+    sink.flush()
+
+
+# Write the CSV (and optionally XLSX / JSON-lines) exports of the stored MCQs, each replaced atomically.
+def export(path, csv_path, xlsx_path=None, json_path=None, columns=None):
+    df = read_mcqs(path, columns)
+    for target, write in [(csv_path, lambda tmp: df.to_csv(tmp, index=True)),
+                          (xlsx_path, lambda tmp: df.to_excel(tmp, index=True)),
+                          (json_path, lambda tmp: df.to_json(tmp, orient='records', lines=True,
+                                                             force_ascii=False))]:
+        if target is None:
+            continue
+        # Keep the extension, which selects the Excel writer.
+        root, extension = os.path.splitext(target)
+        tmp_path = root + '.tmp' + extension
+        write(tmp_path)
+        os.replace(tmp_path, target)
+    return df
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export the MCQs stored by a generation script.')
+    parser.add_argument('path', help='JSON-lines file written by the generation script, e.g. MCQ.jsonl')
+    parser.add_argument('--xlsx', action='store_true', help='Also write an .xlsx export.')
+    parser.add_argument('--json', action='store_true', help='Also write a JSON-lines export (.json).')
+    args = parser.parse_args()
+
+    base = os.path.splitext(args.path)[0]
+    df = export(args.path, base + '.csv', base + '.xlsx' if args.xlsx else None,
+                base + '.json' if args.json else None)
+    print('Exported %d questions to %s.csv' % (len(df), base))
@@ -0,0 +1,118 @@
+# Per-question instrumentation of run.py.
+# One JSON line is written per prepared video (time per preprocessing stage: open, select, decode, resize,
+# encode, ... and whether the frames came from the memory or disk cache) and per question (latency of the
+# answering request, time since the first attempt including retries, attempts, payload bytes, prompt and
+# completion tokens, whether the response cache answered it), plus a final line with the wall time of the run.
+# `summarize` turns such a file into a report with percentiles, throughput and an estimated cost:
+#   python -m utils.metrics result/gpt-4o_metrics.jsonl --prompt-price 2.5 --completion-price 10
+import argparse
+import json
+import threading
+import time
+
+import pandas as pd
+
+from utils.result_journal import read_journal
+from utils.retry import classify_error
+
+
+PERCENTILES = [0.5, 0.9, 0.99]
+
+
+class MetricsRecorder:
+    def __init__(self, path):
+        self.path = path
+        self.start = time.perf_counter()
+        self.file = open(path, 'w', encoding='utf-8')
+        # Videos are recorded from the frame preparation threads, questions from the event loop.
+        self.lock = threading.Lock()
+
+    def _write(self, record):
+        with self.lock:
+            self.file.write(json.dumps(record) + '\n')
+
+    # `timings` is the per-stage wall time filled in by FrameCache.get.
+    def video(self, video_id, elapsed, num_frames, timings):
+        self._write(dict({'type': 'video', 'video_id': str(video_id), 'prepare': elapsed, 'frames': num_frames},
+                         **timings))
+
+    # `info` is the dict handed to on_result by AsyncEvaluator.
+    def question(self, row, video_id, error, info):
+        record = {'type': 'question', 'row': row, 'video_id': str(video_id),
+                  'error': None if error is None else classify_error(error)}
+        for name in ['latency', 'elapsed', 'attempts', 'payload_bytes', 'prompt_tokens', 'completion_tokens',
+                     'cached']:
+            record[name] = info.get(name)
+        self._write(record)
+
+    def close(self):
+        if not self.file.closed:
+            self._write({'type': 'run', 'elapsed': time.perf_counter() - self.start})
+            self.file.close()
+
+
+def percentile_table(df, columns):
+    columns = [column for column in columns if column in df.columns and df[column].notna().any()]
+    if not columns:
+        return None
+    table = df[columns].astype(float).quantile(PERCENTILES).T
+    table.columns = ['p%d' % round(100 * p) for p in PERCENTILES]
+    table.insert(0, 'mean', df[columns].astype(float).mean())
+    table['total'] = df[columns].astype(float).sum()
+    return table
+
+
+# Text report of a metrics file. Prices are per million tokens; leave them None to skip the cost estimate.
+def summarize(path, prompt_price=None, completion_price=None):
+    records = read_journal(path)
+    videos = pd.DataFrame([r for r in records if r.get('type') == 'video'])
+    questions = pd.DataFrame([r for r in records if r.get('type') == 'question'])
+    runs = [r for r in records if r.get('type') == 'run']
+    lines = []
+
+    if len(videos):
+        sources = videos['source'].value_counts() if 'source' in videos.columns else pd.Series(dtype=int)
+        lines.append('Videos: %d (%s)' % (len(videos), ', '.join('%s %d' % item for item in sources.items())))
+        stages = [column for column in videos.columns if column not in ('type', 'video_id', 'frames', 'source')]
+        table = percentile_table(videos, stages)
+        if table is not None:
+            lines.append('Frame preparation per video (s):\n' + table.to_string(float_format='%.3f'))
+
+    if len(questions):
+        failed = questions['error'].notna()
+        answered = questions[~failed]
+        cached = answered['cached'].fillna(False).astype(bool)
+        lines.append('Questions: %d answered (%d from the response cache), %d failed'
+                     % (len(answered), int(cached.sum()), int(failed.sum())))
+        requests = answered[~cached]
+        # latency is the answering attempt alone; elapsed also counts failed attempts and backoff waits.
+        table = percentile_table(requests, ['latency', 'elapsed', 'attempts'])
+        if table is not None:
+            lines.append('Requests (latency and elapsed in s):\n' + table.to_string(float_format='%.3f'))
+        table = percentile_table(answered, ['payload_bytes', 'prompt_tokens', 'completion_tokens'])
+        if table is not None:
+            lines.append('Payload and tokens per question:\n' + table.to_string(float_format='%.0f'))
+        retries = questions['attempts'].fillna(1).clip(lower=1) - 1
+        lines.append('Retries: %d' % int(retries.sum()))
+
+        if runs:
+            elapsed = runs[-1]['elapsed']
+            lines.append('Throughput: %.1f questions/min over %.1f s' % (60 * len(answered) / max(elapsed, 1e-9),
+                                                                        elapsed))
+        if prompt_price is not None or completion_price is not None:
+            # Responses served from the cache cost nothing.
+            prompt_tokens = requests['prompt_tokens'].fillna(0).sum()
+            completion_tokens = requests['completion_tokens'].fillna(0).sum()
+            cost = (prompt_tokens * (prompt_price or 0) + completion_tokens * (completion_price or 0)) / 1e6
+            lines.append('Estimated cost: $%.2f (%d prompt + %d completion tokens)'
+                         % (cost, prompt_tokens, completion_tokens))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Summarize a metrics file written by run.py.')
+    parser.add_argument('path')
+    parser.add_argument('--prompt-price', type=float, default=None, help='USD per million prompt tokens.')
+    parser.add_argument('--completion-price', type=float, default=None, help='USD per million completion tokens.')
+    args = parser.parse_args()
+    print(summarize(args.path, args.prompt_price, args.completion_price))
@@ -0,0 +1,110 @@
+# Minimal OpenAI-compatible server for trying out run.py without a real endpoint.
+# It answers POST /v1/chat/completions with a fixed "Option: A" answer after a configurable latency,
+# and can inject failures to exercise error handling:
+#   python -m utils.mock_openai_server --port 8000 --latency 1.0 --failure-rate 0.1
+# then set base_url='http://127.0.0.1:8000/v1' in run.py. Requests with a JSON schema `response_format` get a
+# JSON answer, unless --no-response-format makes the server reject them like an endpoint without support.
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    latency = 0.5
+    failure_rate = 0.0
+    answer = "Option: A; Reason: mock answer."
+    json_answer = '{"option": "A", "reason": "mock answer."}'
+    response_format = True
+    counter = {'requests': 0, 'in_flight': 0, 'max_in_flight': 0}
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send(404, {'error': {'message': 'not found'}})
+            return
+
+        with self.lock:
+            self.counter['requests'] += 1
+            self.counter['in_flight'] += 1
+            self.counter['max_in_flight'] = max(self.counter['max_in_flight'], self.counter['in_flight'])
+        try:
+            time.sleep(self.latency)
+            if random.random() < self.failure_rate:
+                self._send(500, {'error': {'message': 'injected failure', 'type': 'server_error'}})
+                return
+
+            request = json.loads(body)
+            answer = self.answer
+            if 'response_format' in request:
+                if not self.response_format:
+                    self._send(400, {'error': {'message': "Invalid parameter: 'response_format' is not supported "
+                                                          "with this model.", 'type': 'invalid_request_error'}})
+                    return
+                answer = self.json_answer
+            content = request['messages'][-1]['content']
+            num_images = sum(1 for part in content if part.get('type') == 'image_url') if isinstance(content, list) else 0
+            prompt_tokens = len(body) // 4 if num_images == 0 else 85 * num_images
+            completion_tokens = len(answer) // 4
+            self._send(200, {
+                'id': 'chatcmpl-mock-%d' % self.counter['requests'],
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': request.get('model', 'mock'),
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': answer},
+                    'finish_reason': 'stop'
+                }],
+                'usage': {
+                    'prompt_tokens': prompt_tokens,
+                    'completion_tokens': completion_tokens,
+                    'total_tokens': prompt_tokens + completion_tokens
+                }
+            })
+        finally:
+            with self.lock:
+                self.counter['in_flight'] -= 1
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Start the server in a background thread and return it; call server.shutdown() to stop it.
+def start_server(port=0, latency=0.5, failure_rate=0.0, response_format=True):
+    MockHandler.latency = latency
+    MockHandler.failure_rate = failure_rate
+    MockHandler.response_format = response_format
+    server = ThreadingHTTPServer(('127.0.0.1', port), MockHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Mock OpenAI-compatible chat completions server.')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.5)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--no-response-format', action='store_true',
+                        help='Reject requests with response_format, like an endpoint without structured outputs.')
+    args = parser.parse_args()
+
+    server = start_server(args.port, args.latency, args.failure_rate, not args.no_response_format)
+    print('Serving on http://127.0.0.1:%d/v1' % server.server_address[1])
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
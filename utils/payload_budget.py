@@ -0,0 +1,103 @@
+# Payload budget for image-heavy requests.
+# A request embeds up to `max_frames` base64 images, so its size grows with frame count, resolution and
+# quality. Given a byte and/or image-token budget per request, `fit_to_budget` re-encodes the sampled frames
+# with a lower quality first, then a smaller resolution, and finally fewer frames (still evenly spread over
+# the video) until the payload fits. The frames of a video are shared by all of its questions, so this is
+# done once per video, when the frames are prepared.
+import json
+import math
+
+import numpy as np
+
+from utils.frame_preprocess import preprocess_frames, stage
+
+
+# Quality used by OpenCV when none is given.
+DEFAULT_QUALITY = 95
+
+# JSON around every image part of a request: {"type": "image_url", "image_url": {"url": "data:...;base64,"}}.
+IMAGE_PART_OVERHEAD = 80
+
+
+# Image tokens of one image, following the OpenAI high-detail rule: fit into 2048x2048, scale the shorter
+# side down to 768, then 170 tokens per 512px tile plus 85.
+def image_tokens(width, height):
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+# Size in bytes of the JSON body of a chat request.
+def payload_bytes(messages):
+    return len(json.dumps(messages))
+
+
+# `k` indices evenly spread over `n` frames, always keeping the first and the last one.
+def evenly_spaced(n, k):
+    if k >= n:
+        return list(range(n))
+    if k <= 1:
+        return list(range(k))
+    return sorted(set(np.linspace(0, n - 1, k).round().astype(int).tolist()))
+
+
+class PayloadBudget:
+    def __init__(self, max_bytes=None, max_image_tokens=None, prompt_bytes=4096, min_frames=8, min_side=256,
+                 min_quality=40):
+        # `prompt_bytes` is reserved for the text part of the request.
+        self.max_bytes = max_bytes
+        self.max_image_tokens = max_image_tokens
+        self.prompt_bytes = prompt_bytes
+        self.min_frames = min_frames
+        self.min_side = min_side
+        self.min_quality = min_quality
+
+    # Identifies the budget in cache keys.
+    def key(self):
+        return [self.max_bytes, self.max_image_tokens, self.prompt_bytes, self.min_frames, self.min_side,
+                self.min_quality]
+
+    def over_bytes(self, encoded):
+        if self.max_bytes is None:
+            return False
+        return self.prompt_bytes + sum(len(frame) + IMAGE_PART_OVERHEAD for frame in encoded) > self.max_bytes
+
+    def over_tokens(self, count, width, height):
+        if self.max_image_tokens is None:
+            return False
+        return count * image_tokens(width, height) > self.max_image_tokens
+
+
+# Encode `frames` so that they fit `budget`, degrading quality, then resolution, then frame count.
+# Returns the encoded frames and the settings that were used.
+def fit_to_budget(frames, budget, max_side=None, image_format='jpeg', quality=None, workers=4, timings=None):
+    if len(frames) == 0:
+        return [], {}
+    height, width = frames[0].shape[:2]
+    side = min(max_side or max(height, width), max(height, width))
+    quality = quality if quality is not None else DEFAULT_QUALITY
+    count = len(frames)
+
+    while True:
+        selected = [frames[i] for i in evenly_spaced(len(frames), count)]
+        encoded = preprocess_frames(selected, side, image_format, quality, workers, timings)
+        scale = side / max(height, width)
+        settings = {'frames': len(encoded), 'max_side': side, 'quality': quality}
+        over_tokens = budget.over_tokens(len(encoded), round(width * scale), round(height * scale))
+        if not over_tokens and not budget.over_bytes(encoded):
+            return encoded, settings
+
+        with stage(timings, 'budget'):
+            # Quality does not change the number of image tokens, so skip it when only tokens are over.
+            if quality > budget.min_quality and not over_tokens:
+                quality = max(budget.min_quality, quality - 15)
+            elif side > budget.min_side:
+                side = max(budget.min_side, int(side * 0.75))
+            elif count > budget.min_frames:
+                count = max(budget.min_frames, int(count * 0.75))
+            else:
+                # Nothing left to degrade; send the smallest payload we can make.
+                print('Payload budget cannot be met with %s' % settings)
+                return encoded, settings
@@ -0,0 +1,128 @@
+# Quota-bounded remote storage for the videos uploaded by the generation scripts.
+# Uploaded videos are kept in the cloud for reuse (see utils/upload_registry.py) until a quota of bytes and/or
+# files would be exceeded by a new upload. Only then are the least recently used uploads deleted, and never
+# one that is still in use: `acquire` pins a video until the matching `release`, i.e. for as long as
+# generation requests on it are in flight. If every upload is pinned, the new one goes over the quota rather
+# than waiting. Try it against the local fake of the file API with
+#   python -m utils.remote_storage
+import os
+import tempfile
+import threading
+from collections import Counter
+
+from utils.upload_registry import POLL_INTERVAL, UploadRegistry
+
+
+class RemoteStorage:
+    def __init__(self, file_api, registry, max_bytes=None, max_files=None, poll_interval=POLL_INTERVAL):
+        self.file_api = file_api
+        self.registry = registry
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.poll_interval = poll_interval
+        self.pins = Counter()
+        self.remote_hashes = {}
+        # Room taken by uploads in progress, which are not in the registry yet.
+        self.reserved = {'bytes': 0, 'files': 0}
+        self.stats = {'evicted': 0, 'over_quota': 0}
+        # Videos are acquired and released from several threads; eviction decisions are made one at a time.
+        self.lock = threading.Lock()
+
+    # Remote file of a local video, uploaded if needed and pinned until `release(file)`. With wait=False the
+    # file may still be PROCESSING (see utils/upload_pipeline.py).
+    def acquire(self, path, wait=True):
+        content_hash = self.registry.content_hash(path)
+        with self.lock:
+            self.pins[content_hash] += 1
+        reserved = []
+
+        def before_upload(size):
+            self.make_room(size)
+            reserved.append(size)
+
+        try:
+            file = self.registry.ensure_uploaded(self.file_api, path, self.poll_interval, before_upload, wait)
+        except Exception:
+            self._unpin(content_hash)
+            raise
+        finally:
+            with self.lock:
+                for size in reserved:
+                    self.reserved['bytes'] -= size
+                    self.reserved['files'] -= 1
+        with self.lock:
+            self.remote_hashes[file.name] = content_hash
+        return file
+
+    def release(self, file):
+        with self.lock:
+            content_hash = self.remote_hashes.get(file.name)
+        if content_hash is not None:
+            self._unpin(content_hash)
+
+    def _unpin(self, content_hash):
+        with self.lock:
+            self.pins[content_hash] -= 1
+            if self.pins[content_hash] <= 0:
+                del self.pins[content_hash]
+
+    def _over_quota(self, entries, size):
+        if self.max_files is not None and len(entries) + self.reserved['files'] + 1 > self.max_files:
+            return True
+        if self.max_bytes is not None and \
+                sum(entry['size'] for entry in entries) + self.reserved['bytes'] + size > self.max_bytes:
+            return True
+        return False
+
+    # Delete least recently used, unpinned uploads until one of `size` bytes fits in the quota, and reserve
+    # the room for it.
+    def make_room(self, size):
+        with self.lock:
+            entries = self.registry.lru_entries()
+            for entry in list(entries):
+                if not self._over_quota(entries, size):
+                    break
+                if entry['content_hash'] in self.pins:
+                    continue
+                print('Evicting remote file', entry['remote_name'])
+                try:
+                    self.file_api.delete_file(entry['remote_name'])
+                except Exception:
+                    # Already gone (expired or deleted elsewhere).
+                    pass
+                self.registry.remove(entry['content_hash'])
+                entries.remove(entry)
+                self.stats['evicted'] += 1
+            if self._over_quota(entries, size):
+                print('All remote files are in use, uploading over the quota.')
+                self.stats['over_quota'] += 1
+            self.reserved['bytes'] += size
+            self.reserved['files'] += 1
+
+    def report(self):
+        return ', '.join('%s %d' % item for item in self.stats.items())
+
+
+if __name__ == '__main__':
+    from utils.fake_file_api import FakeFileAPI
+
+    # Eight 1 MB videos with room for three of them; video 0 is used throughout and must survive.
+    with tempfile.TemporaryDirectory() as folder:
+        paths = []
+        for i in range(8):
+            paths.append(os.path.join(folder, 'video_%d.mp4' % i))
+            with open(paths[-1], 'wb') as file:
+                file.write(os.urandom(1 << 20))
+
+        api = FakeFileAPI(processing_time=0.05)
+        registry = UploadRegistry(os.path.join(folder, 'uploads.sqlite'))
+        storage = RemoteStorage(api, registry, max_bytes=3 << 20, poll_interval=0.01)
+        pinned = storage.acquire(paths[0])
+        for path in paths[1:] + paths[5:]:
+            storage.release(storage.acquire(path))
+        assert pinned.name in api.files, 'a pinned file was evicted'
+        storage.release(pinned)
+        print('Remote files: %d (%.1f MB); uploads %d, deletes %d; %s; registry: %s'
+              % (len(api.files), api.stored_bytes() / 2 ** 20, api.stats['uploads'], api.stats['deletes'],
+                 storage.report(), registry.report()))
+        registry.close()
@@ -0,0 +1,125 @@
+# Persistent cache of model responses.
+# Responses are stored in SQLite, keyed by the model name, a hash of the prompt text (and request
+# parameters) and a hash of the exact image payload. Re-running a model on the same questions and frames is
+# answered from the cache without any network call. Entries expire after `ttl` seconds, and the least
+# recently used entries are evicted when the cache grows beyond `max_entries` or `max_bytes`.
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+# Hashes of the text parts (plus extra request parameters) and of the image parts of a chat request.
+def request_hashes(messages, params=None):
+    prompt_hash = hashlib.sha256(json.dumps(params or {}, sort_keys=True).encode('utf-8'))
+    image_hash = hashlib.sha256()
+    for message in messages:
+        content = message['content']
+        if isinstance(content, str):
+            content = [{'type': 'text', 'text': content}]
+        for part in content:
+            if part['type'] == 'text':
+                prompt_hash.update(part['text'].encode('utf-8'))
+            else:
+                image_hash.update(part['image_url']['url'].encode('utf-8'))
+            # Separator, so that moving text between parts changes the hash.
+            prompt_hash.update(b'\0')
+    return prompt_hash.hexdigest(), image_hash.hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path='cache/responses.sqlite', ttl=None, max_entries=None, max_bytes=None, evict_every=256):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+        self.puts = 0
+        self.stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evicted': 0}
+        self.lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                model TEXT NOT NULL,
+                prompt_hash TEXT NOT NULL,
+                image_hash TEXT NOT NULL,
+                output TEXT NOT NULL,
+                usage TEXT,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL,
+                PRIMARY KEY (model, prompt_hash, image_hash)
+            )''')
+        self.db.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+        self.db.commit()
+        self.evict()
+
+    def get(self, model, messages, params=None):
+        key = (model,) + request_hashes(messages, params)
+        with self.lock:
+            row = self.db.execute('SELECT output, usage, created FROM responses '
+                                  'WHERE model = ? AND prompt_hash = ? AND image_hash = ?', key).fetchone()
+            if row is not None and self.ttl is not None and time.time() - row[2] > self.ttl:
+                self.db.execute('DELETE FROM responses WHERE model = ? AND prompt_hash = ? AND image_hash = ?', key)
+                self.db.commit()
+                self.stats['expired'] += 1
+                row = None
+            if row is None:
+                self.stats['misses'] += 1
+                return None
+            self.db.execute('UPDATE responses SET accessed = ? '
+                            'WHERE model = ? AND prompt_hash = ? AND image_hash = ?', (time.time(),) + key)
+            self.db.commit()
+            self.stats['hits'] += 1
+        return {'output': row[0], 'usage': json.loads(row[1]) if row[1] else None}
+
+    def put(self, model, messages, output, usage=None, params=None):
+        key = (model,) + request_hashes(messages, params)
+        now = time.time()
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                            key + (output, json.dumps(usage) if usage else None, len(output.encode('utf-8')),
+                                   now, now))
+            self.db.commit()
+            self.puts += 1
+        if self.puts % self.evict_every == 0:
+            self.evict()
+
+    # Drop expired entries, then the least recently used ones until the size limits are met.
+    def evict(self):
+        with self.lock:
+            if self.ttl is not None:
+                cursor = self.db.execute('DELETE FROM responses WHERE created < ?', (time.time() - self.ttl,))
+                self.stats['expired'] += cursor.rowcount
+            count, size = self.db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+            excess = 0
+            if self.max_entries is not None:
+                excess = max(excess, count - self.max_entries)
+            if self.max_bytes is not None and size > self.max_bytes:
+                # Walk the entries from the least recently used one until enough bytes are freed.
+                freed = 0
+                for i, (entry_size,) in enumerate(self.db.execute('SELECT size FROM responses ORDER BY accessed')):
+                    if size - freed <= self.max_bytes:
+                        break
+                    freed += entry_size
+                    excess = max(excess, i + 1)
+            if excess > 0:
+                self.db.execute('DELETE FROM responses WHERE rowid IN '
+                                '(SELECT rowid FROM responses ORDER BY accessed LIMIT ?)', (excess,))
+                self.stats['evicted'] += excess
+            self.db.commit()
+
+    def report(self):
+        lookups = self.stats['hits'] + self.stats['misses']
+        return ('%d hits, %d misses (%.0f%% hit rate), %d expired, %d evicted'
+                % (self.stats['hits'], self.stats['misses'], 100 * self.stats['hits'] / max(lookups, 1),
+                   self.stats['expired'], self.stats['evicted']))
+
+    def close(self):
+        self.db.close()
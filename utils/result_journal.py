@@ -0,0 +1,139 @@
+# Append-only journal of model outputs.
+# Every answered (or finally failed) question is appended as one JSON line with its row index, model,
+# output, latency and token usage, instead of rewriting the whole result CSV after each question.
+# Writes are flushed and fsync'ed in batches, and a torn last line left by a killed process is ignored
+# on reading. `compact` turns the journal into the `<model>_output.csv` that eval.py expects (and a
+# `<model>_output.parquet` copy for columnar scoring).
+import json
+import os
+import tempfile
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+# Append-only JSON-lines file, flushed and fsync'ed every `flush_every` records or `flush_interval` seconds.
+# Also used for the MCQs of the generation scripts (utils/mcq_sink.py); read it back with `read_journal`.
+class JsonLinesWriter:
+    def __init__(self, path, flush_every=16, flush_interval=5.0):
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.unflushed = 0
+        self.last_flush = time.monotonic()
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.unflushed += 1
+        if self.unflushed >= self.flush_every or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unflushed = 0
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ResultJournal(JsonLinesWriter):
+    def __init__(self, path, model, flush_every=16, flush_interval=5.0):
+        super().__init__(path, flush_every, flush_interval)
+        self.model = model
+
+    def append(self, row, output, error=None, latency=None, prompt_tokens=None, completion_tokens=None, **extra):
+        record = {
+            'row': row,
+            'model': self.model,
+            'output': output,
+            'error': None if error is None else str(error),
+            'latency': latency,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'time': time.time()
+        }
+        record.update(extra)
+        self.write(record)
+
+
+# Read all complete records of one or more JSON-lines files, skipping a torn or corrupt line.
+def read_journal(paths):
+    records = []
+    for path in [paths] if isinstance(paths, str) else paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    return records
+
+
+# Latest successful record of every row in the journal(s).
+def completed_records(paths):
+    records = {}
+    for record in read_journal(paths):
+        if record.get('error') is None and record.get('output') is not None:
+            records[record['row']] = record
+    return records
+
+
+# Write the questions table with an 'Output' column filled from the journal(s), in the CSV layout that
+# eval.py reads, and optionally as Parquet too. Options parsed at request time (structured output mode) are
+# written to an 'Option' column. `batches` yields the question table in pieces (see
+# utils/dataset_reader.py), so the full table is never held in memory. The files are replaced atomically,
+# so an interrupted compaction never corrupts them.
+def compact(paths, batches, csv_path, parquet_path=None):
+    records = completed_records(paths)
+    has_options = any(record.get('option') is not None for record in records.values())
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(csv_path)), suffix='.tmp')
+    os.close(fd)
+    writer = None
+    header = True
+    for batch in batches:
+        batch = batch.copy()
+        rows = [records.get(row, {}) for row in batch.index.tolist()]
+        batch['Output'] = pd.Series([record.get('output') for record in rows], index=batch.index, dtype=object)
+        if has_options:
+            batch['Option'] = pd.Series([record.get('option') for record in rows], index=batch.index, dtype=object)
+        batch.to_csv(tmp_path, mode='w' if header else 'a', header=header)
+        header = False
+
+        if parquet_path is not None:
+            if writer is None:
+                schema = pa.Schema.from_pandas(batch, preserve_index=True)
+                for name in ['Output', 'Option'] if has_options else ['Output']:
+                    schema = schema.set(schema.get_field_index(name), pa.field(name, pa.string()))
+                parquet_tmp_path = parquet_path + '.tmp'
+                writer = pq.ParquetWriter(parquet_tmp_path, schema)
+            writer.write_table(pa.Table.from_pandas(batch, schema=schema, preserve_index=True))
+
+    os.replace(tmp_path, csv_path)
+    if writer is not None:
+        writer.close()
+        os.replace(parquet_tmp_path, parquet_path)
+
+
+# Seed a new journal from an existing result CSV written by an older version of run.py.
+def import_csv(csv_path, journal):
+    res = pd.read_csv(csv_path, index_col=0)
+    for row, output in res['Output'].items():
+        if pd.notna(output):
+            journal.append(int(row), output, source='csv')
+    journal.flush()
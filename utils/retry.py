@@ -0,0 +1,89 @@
+# Retry policy for API calls.
+# Errors are classified (rate limit, timeout, server error, content error, client error) and only the
+# transient classes are retried, with exponential backoff and full jitter. A Retry-After header sent by
+# the endpoint takes precedence over the computed delay. Rows that use up their attempt budget, or fail
+# with a non-retryable error, end up in the dead-letter list instead of being silently dropped.
+import datetime
+import email.utils
+import random
+import time
+
+import openai
+
+
+RETRYABLE = {'rate_limit', 'timeout', 'server'}
+
+
+# Raised when the endpoint answers without any message content (e.g. a filtered completion).
+class EmptyResponseError(Exception):
+    pass
+
+
+def classify_error(error):
+    if isinstance(error, openai.RateLimitError):
+        return 'rate_limit'
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, TimeoutError)):
+        return 'timeout'
+    if isinstance(error, openai.APIStatusError):
+        if error.status_code == 429:
+            return 'rate_limit'
+        if error.status_code == 408:
+            return 'timeout'
+        if error.status_code >= 500:
+            return 'server'
+        message = str(error).lower()
+        if 'content' in message and ('filter' in message or 'policy' in message):
+            return 'content'
+        return 'client'
+    if isinstance(error, EmptyResponseError):
+        return 'content'
+    return 'client'
+
+
+# Seconds requested by the Retry-After (or retry-after-ms) header of a failed response, if any.
+def retry_after(error):
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    headers = response.headers
+    if headers.get('retry-after-ms'):
+        try:
+            return float(headers['retry-after-ms']) / 1000
+        except ValueError:
+            pass
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    # Retry-After may also be an HTTP date; a malformed value is ignored.
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, date.timestamp() - time.time())
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts=5, base_delay=2.0, max_delay=120.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    # Exponential backoff with full jitter for the given (1-based) attempt that just failed.
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    # Seconds to wait before the next attempt, or None if the row should be given up on.
+    def next_delay(self, error, attempt):
+        if classify_error(error) not in RETRYABLE or attempt >= self.max_attempts:
+            return None
+        delay = self.backoff(attempt)
+        requested = retry_after(error)
+        if requested is not None:
+            delay = max(delay, min(requested, self.max_delay))
+        return delay
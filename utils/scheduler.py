@@ -0,0 +1,62 @@
+# Group-by-video scheduling of the evaluation work.
+# Questions of the same video are scattered across MCQ.parquet. Reordering the pending rows by video
+# lets each video's frames be prepared once, used for all of its questions and then released, so decode
+# cost grows with the number of videos and memory stays flat. Row positions are kept as-is, so results
+# are still written back to their original rows. `plan_resume` restricts the work to the rows that are
+# still missing or failed in an earlier run.
+from collections import OrderedDict
+
+
+# Group row positions by video id. Videos keep the order of their first pending question, and the
+# rows of one video keep their original order.
+def group_by_video(video_ids, positions):
+    groups = OrderedDict()
+    for position in positions:
+        groups.setdefault(video_ids[position], []).append(position)
+    return list(groups.items())
+
+
+# Work left for a run: the rows without a successful output, grouped by video.
+class ResumePlan:
+    def __init__(self, groups, total, answered, errored, missing):
+        self.groups = groups
+        self.total = total
+        self.answered = answered
+        self.errored = errored
+        self.missing = missing
+
+    @property
+    def pending(self):
+        return [position for _, positions in self.groups for position in positions]
+
+    def report(self):
+        return ('%d of %d questions remaining (%d never answered, %d failed before) across %d videos; '
+                '%d already answered.' % (len(self.pending), self.total, len(self.missing), len(self.errored),
+                                          len(self.groups), self.answered))
+
+
+# Plan which rows still need to be sent, from the result journal records of earlier runs.
+# A row is done once any record holds a successful output for it; rows whose records are all errors
+# are retried, and rows without any record are sent for the first time.
+# `positions` restricts the plan to a subset of the rows, e.g. one shard.
+def plan_resume(video_ids, rows, records, positions=None):
+    succeeded, failed = set(), set()
+    for record in records:
+        if record.get('error') is None and record.get('output') is not None:
+            succeeded.add(record['row'])
+        else:
+            failed.add(record['row'])
+
+    if positions is None:
+        positions = range(len(rows))
+
+    errored, missing = [], []
+    for position in positions:
+        row = rows[position]
+        if row in succeeded:
+            continue
+        (errored if row in failed else missing).append(position)
+
+    pending = sorted(errored + missing)
+    return ResumePlan(group_by_video(video_ids, pending), len(positions), len(positions) - len(pending),
+                      errored, missing)
@@ -0,0 +1,91 @@
+# Vectorized scoring of result files.
+# Result files (CSV, or the Parquet files written next to them by run.py) are read with only the columns
+# needed for scoring, the chosen options are extracted with the vectorized rule cascade of
+# utils/answer_extraction.py, and accuracy per
+# model, per category and per video is computed from a single groupby over the rows of all files.
+import os
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from utils.answer_extraction import extract_options_batch
+
+
+# `question` is used to find the valid option letters of each question; `Option` holds the options parsed at
+# request time in structured output mode.
+SCORING_COLUMNS = ['video_id', 'question', 'question_category', 'answer', 'Output', 'Option']
+
+
+# result/gpt-4o_output.csv -> gpt-4o
+def model_name(path):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return name[:-len('_output')] if name.endswith('_output') else name
+
+
+# Read the scoring columns of a result file, keeping the row index of the questions table.
+def read_results(path, columns=SCORING_COLUMNS):
+    if path.endswith('.parquet'):
+        available = pq.ParquetFile(path).schema_arrow.names
+        # The pandas metadata restores the index written by compact, which is not among `columns`.
+        return pq.read_table(path, columns=[c for c in columns if c in available],
+                             use_pandas_metadata=True).to_pandas()
+    # The unnamed first column of the CSV is the row index.
+    return pd.read_csv(path, index_col=0, usecols=lambda c: c in columns or c == '' or c.startswith('Unnamed'))
+
+
+# Concatenate the results of all files with `model` and `row` (row index of the question) columns, the
+# extracted option and the extraction rule that matched, and a boolean `correct` column. Rows without a
+# string output are dropped; outputs without a valid option count as wrong answers.
+def score_frames(paths):
+    frames = []
+    for path in paths:
+        df = read_results(path)
+        df['model'] = model_name(path)
+        df['row'] = df.index
+        frames.append(df)
+    df = pd.concat(frames, ignore_index=True)
+    # Options stored at request time are compared directly; only the other outputs are parsed.
+    # Default runs and older result files have no 'Option' column.
+    options = df['Option'] if 'Option' in df.columns else pd.Series(None, index=df.index, dtype=object)
+    structured = options.notna()
+    extracted = extract_options_batch(df['Output'].where(~structured),
+                                      df['question'] if 'question' in df.columns else None)
+    if structured.any():
+        extracted.loc[structured, 'Extracted_Option'] = options[structured]
+        extracted.loc[structured, 'Extraction_Rule'] = 'structured'
+    df = pd.concat([df, extracted], axis=1)
+    df = df.dropna(subset=['Extraction_Rule'])
+    df['correct'] = (df['Extracted_Option'] == df['answer']).fillna(False).astype(bool)
+    return df
+
+
+# Accuracy per model x category, per model x video and per model, computed from one groupby pass over the
+# rows; the coarser levels are rolled up from the (small) finest-level counts.
+def accuracy_tables(df):
+    if 'video_id' not in df.columns:
+        df = df.assign(video_id='')
+    counts = df.groupby(['model', 'question_category', 'video_id'], sort=True)['correct'].agg(['sum', 'size'])
+
+    def roll_up(levels):
+        table = counts.groupby(level=levels).sum()
+        table['Accuracy'] = table['sum'] / table['size']
+        return table.rename(columns={'sum': 'Correct', 'size': 'Num'}).reset_index()
+
+    return {
+        'category': roll_up(['model', 'question_category']),
+        'video': roll_up(['model', 'video_id']),
+        'model': roll_up(['model']),
+    }
+
+
+# The per-category table of one model in the layout of eval.py's xlsx output, with a 'Total' row.
+def category_report(tables, model):
+    category = tables['category']
+    category = category[category['model'] == model]
+    report = pd.DataFrame({
+        'Category': category['question_category'].tolist(),
+        'Accuracy': category['Accuracy'].tolist(),
+        'Num': category['Num'].tolist(),
+    })
+    total = tables['model'].set_index('model').loc[model, 'Accuracy']
+    return pd.concat([report, pd.DataFrame([{'Category': 'Total', 'Accuracy': total}])], ignore_index=True)
@@ -0,0 +1,40 @@
+# Deterministic sharding of the evaluation by video.
+# `--shard i/N` evaluates only the videos whose stable hash falls into shard i (0-based), so the frames of
+# every video are decoded by exactly one worker. Each shard appends to its own journal next to the main
+# one; compacting all of `journal_paths` merges them into the single `<model>_output.csv` for eval.py.
+import glob
+import hashlib
+import os
+
+
+def parse_shard(text):
+    try:
+        shard, num_shards = (int(part) for part in text.split('/'))
+    except ValueError:
+        raise ValueError("Shard must look like 'i/N', got %r" % text)
+    if num_shards < 1 or not 0 <= shard < num_shards:
+        raise ValueError('Shard index must be in [0, %d), got %d' % (num_shards, shard))
+    return shard, num_shards
+
+
+# Stable across processes and machines, unlike the builtin hash() of a string.
+def shard_of(video_id, num_shards):
+    digest = hashlib.sha1(str(video_id).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % num_shards
+
+
+def shard_positions(video_ids, shard, num_shards):
+    return [position for position, video_id in enumerate(video_ids) if shard_of(video_id, num_shards) == shard]
+
+
+# result/<model>_output.jsonl -> result/<model>_output.shard-0-of-4.jsonl
+def shard_path(path, shard, num_shards):
+    base, ext = os.path.splitext(path)
+    return '%s.shard-%d-of-%d%s' % (base, shard, num_shards, ext)
+
+
+# The main journal followed by every shard journal written next to it, if they exist.
+def journal_paths(path):
+    base, ext = os.path.splitext(path)
+    paths = [path] if os.path.exists(path) else []
+    return paths + sorted(glob.glob(glob.escape(base) + '.shard-*-of-*' + ext))
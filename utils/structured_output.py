@@ -0,0 +1,61 @@
+# Structured answers for run.py.
+# In structured mode the model is asked for a JSON object {"option": ..., "reason": ...}, enforced with a JSON
+# schema through `response_format` where the endpoint supports it. An endpoint that rejects `response_format`
+# is detected from its error (see AsyncEvaluator), and the request is sent again without it; the prompt still
+# asks for the same JSON object. The answer is parsed by `parse_answer` at request time, falling back to the
+# rules of utils/answer_extraction.py when it is not valid JSON, and the option is stored in its own column.
+import json
+import re
+
+import openai
+
+from utils.answer_extraction import extract_option, last_option
+
+
+OPTION_LETTERS = ['A', 'B', 'C', 'D', 'E']
+
+# Markdown code fence around a JSON answer.
+FENCE_PATTERN = re.compile(r'^\s*```(?:json)?\s*|\s*```\s*$')
+
+
+def answer_schema(include_reason=True):
+    properties = {'option': {'type': 'string', 'enum': OPTION_LETTERS}}
+    if include_reason:
+        properties['reason'] = {'type': 'string'}
+    return {
+        'type': 'object',
+        'properties': properties,
+        'required': list(properties),
+        'additionalProperties': False
+    }
+
+
+# `response_format` request parameter for a JSON answer.
+def response_format(include_reason=True):
+    return {
+        'type': 'json_schema',
+        'json_schema': {'name': 'mcq_answer', 'strict': True, 'schema': answer_schema(include_reason)}
+    }
+
+
+# Whether `error` says that the endpoint does not support `response_format` (or JSON schemas).
+def is_unsupported_response_format(error):
+    if not isinstance(error, openai.APIStatusError) or error.status_code not in (400, 404, 422):
+        return False
+    message = str(error).lower()
+    return 'response_format' in message or 'json_schema' in message or 'json schema' in message
+
+
+# Option letter of an answer: the "option" field of a JSON answer, otherwise the extraction rules.
+def parse_answer(content, question=None):
+    if not isinstance(content, str):
+        return None
+    try:
+        data = json.loads(FENCE_PATTERN.sub('', content))
+    except ValueError:
+        data = None
+    if isinstance(data, dict) and isinstance(data.get('option'), str):
+        option = data['option'].strip().strip('[]()').upper()
+        if len(option) == 1 and 'A' <= option <= last_option(question):
+            return option
+    return extract_option(content, question)[0]
@@ -0,0 +1,169 @@
+# Pipelined uploads for the generation scripts in question_generation/.
+# Instead of uploading a video, polling it every 10 seconds until it has left the PROCESSING state and only
+# then generating its questions, the next `lookahead` videos are uploaded ahead of time by `uploaders` worker
+# threads. One poller thread checks all the files that are still PROCESSING together, each with its own
+# interval that starts short and grows (processing usually takes seconds, but long videos can take minutes).
+# Files are handed to the generation stage through a queue as soon as they are ready, so upload and processing
+# overlap with the generation of earlier videos. Try it against the local fake of the file API with
+#   python -m utils.upload_pipeline
+import os
+import queue
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.upload_registry import POLL_INTERVAL, UploadRegistry, state_name
+
+
+MIN_POLL_INTERVAL = 1.0
+
+POLL_BACKOFF = 1.5
+
+
+class UploadPipeline:
+    def __init__(self, storage, uploaders=2, lookahead=4, min_poll_interval=MIN_POLL_INTERVAL,
+                 max_poll_interval=POLL_INTERVAL, backoff=POLL_BACKOFF):
+        self.storage = storage
+        self.uploaders = uploaders
+        self.lookahead = lookahead
+        self.min_poll_interval = min_poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.backoff = backoff
+        self.ready = queue.Queue()
+        # Videos uploaded ahead of the generation stage, i.e. acquired but not yet taken from the queue.
+        self.slots = threading.Semaphore(lookahead)
+        # Files that are still PROCESSING: [video, path, file, next poll time, interval].
+        self.processing = []
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.stats = {'uploaded': 0, 'polls': 0, 'failed': 0, 'waited': 0.0}
+
+    # Yield (video, file, error) for every video as soon as its file is ready (not necessarily in the order of
+    # `videos`), where path_of(video) is the local path of a video. The consumer holds the file until it calls
+    # storage.release(file).
+    def run(self, videos, path_of):
+        videos = list(videos)
+        executor = ThreadPoolExecutor(max_workers=self.uploaders)
+        threads = [threading.Thread(target=self._feed, args=(videos, path_of, executor), daemon=True),
+                   threading.Thread(target=self._poll, daemon=True)]
+        for thread in threads:
+            thread.start()
+        try:
+            for _ in videos:
+                start = time.monotonic()
+                item = self.ready.get()
+                self.stats['waited'] += time.monotonic() - start
+                self.slots.release()
+                yield item
+        finally:
+            with self.condition:
+                self.stopped = True
+                self.condition.notify_all()
+            # Unblock the feeder if the consumer stopped early.
+            for _ in videos:
+                self.slots.release()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _feed(self, videos, path_of, executor):
+        for video in videos:
+            self.slots.acquire()
+            if self.stopped:
+                return
+            try:
+                path = path_of(video)
+            except Exception as e:
+                # E.g. a video list entry without a name; the consumer still gets one item per video.
+                self.ready.put((video, None, e))
+                continue
+            executor.submit(self._upload, video, path)
+
+    def _upload(self, video, path):
+        try:
+            file = self.storage.acquire(path, wait=False)
+        except Exception as e:
+            self.ready.put((video, None, e))
+            return
+        with self.condition:
+            self.stats['uploaded'] += 1
+        if state_name(file) != 'PROCESSING':
+            self._settle(video, path, file)
+            return
+        with self.condition:
+            self.processing.append([video, path, file, time.monotonic() + self.min_poll_interval,
+                                    self.min_poll_interval])
+            self.condition.notify()
+
+    def _settle(self, video, path, file):
+        try:
+            file = self.storage.registry.settle(self.storage.registry.content_hash(path), file)
+        except Exception as e:
+            with self.condition:
+                self.stats['failed'] += 1
+            self.storage.release(file)
+            self.ready.put((video, None, e))
+            return
+        self.ready.put((video, file, None))
+
+    def _poll(self):
+        while True:
+            with self.condition:
+                while not self.stopped and not self.processing:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                wait = min(entry[3] for entry in self.processing) - time.monotonic()
+                if wait > 0:
+                    # Woken early by a new upload, which may be due sooner.
+                    self.condition.wait(wait)
+                    continue
+                now = time.monotonic()
+                due = [entry for entry in self.processing if entry[3] <= now]
+            for entry in due:
+                video, path, file, _, interval = entry
+                self.stats['polls'] += 1
+                try:
+                    file = self.storage.file_api.get_file(file.name)
+                except Exception as e:
+                    with self.condition:
+                        self.processing.remove(entry)
+                    self.storage.release(file)
+                    self.ready.put((video, None, e))
+                    continue
+                if state_name(file) == 'PROCESSING':
+                    interval = min(interval * self.backoff, self.max_poll_interval)
+                    entry[2:] = [file, time.monotonic() + interval, interval]
+                    continue
+                with self.condition:
+                    self.processing.remove(entry)
+                self._settle(video, path, file)
+
+    def report(self):
+        return 'uploaded %d, polls %d, failed %d, waited for uploads %.1fs' % (
+            self.stats['uploaded'], self.stats['polls'], self.stats['failed'], self.stats['waited'])
+
+
+if __name__ == '__main__':
+    from utils.fake_file_api import FakeFileAPI
+    from utils.remote_storage import RemoteStorage
+
+    # Eight videos taking 0.5 s to upload and 2 s to process, "generated" for 1 s each: serially this takes
+    # 8 * 3.5 s, pipelined mostly the generation time.
+    with tempfile.TemporaryDirectory() as folder:
+        paths = []
+        for i in range(8):
+            paths.append(os.path.join(folder, 'video_%d.mp4' % i))
+            with open(paths[-1], 'wb') as file:
+                file.write(os.urandom(1 << 16))
+
+        api = FakeFileAPI(upload_time=0.5, processing_time=2.0)
+        registry = UploadRegistry(os.path.join(folder, 'uploads.sqlite'))
+        storage = RemoteStorage(api, registry)
+        pipeline = UploadPipeline(storage, uploaders=2, lookahead=4, min_poll_interval=0.25)
+        start = time.monotonic()
+        for path, file, error in pipeline.run(paths, lambda path: path):
+            assert error is None, error
+            time.sleep(1.0)
+            storage.release(file)
+        print('Processed %d videos in %.1fs; %s' % (len(paths), time.monotonic() - start, pipeline.report()))
+        registry.close()
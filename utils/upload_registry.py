@@ -0,0 +1,188 @@
+# Persistent registry of videos uploaded to the Gemini file API, for the scripts in question_generation/.
+# Uploads are recorded in SQLite under the SHA-256 of the video content, with the remote file name, URI,
+# state and expiry time, so a restart (or a renamed copy of the same video) reuses the remote file instead of
+# uploading and processing it again. A recorded file is only checked against the API when it is about to be
+# used, and it is uploaded again only if it has expired or is gone from remote storage. Content hashes are
+# cached by (path, size, mtime), so unchanged videos are not hashed on every run.
+#
+# `file_api` is the google.generativeai module, or any object with the same upload_file / get_file /
+# delete_file functions.
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+# Uploaded files are kept by the API for 48 hours; entries are treated as expired a bit earlier.
+DEFAULT_TTL = 47 * 3600
+
+POLL_INTERVAL = 10
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def state_name(file):
+    return getattr(file.state, 'name', str(file.state))
+
+
+# Expiry of a remote file as a Unix timestamp, from its `expiration_time` if the API reports one.
+def expiry_time(file, ttl=DEFAULT_TTL):
+    expiration = getattr(file, 'expiration_time', None)
+    if expiration is not None and hasattr(expiration, 'timestamp'):
+        return min(expiration.timestamp(), time.time() + ttl)
+    return time.time() + ttl
+
+
+class UploadRegistry:
+    def __init__(self, path='cache/uploads.sqlite', ttl=DEFAULT_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.stats = {'reused': 0, 'uploaded': 0, 'expired': 0, 'missing': 0}
+        # Uploads may be registered from several worker threads.
+        self.lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS uploads (
+                content_hash TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                remote_name TEXT NOT NULL,
+                uri TEXT,
+                state TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                uploaded REAL NOT NULL,
+                expires REAL NOT NULL,
+                accessed REAL NOT NULL
+            )''')
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS hashes (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                content_hash TEXT NOT NULL
+            )''')
+        self.db.commit()
+
+    # SHA-256 of a local video, cached while its size and modification time are unchanged.
+    def content_hash(self, path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self.lock:
+            row = self.db.execute('SELECT size, mtime_ns, content_hash FROM hashes WHERE path = ?',
+                                  (path,)).fetchone()
+        if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return row[2]
+        content_hash = file_sha256(path)
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?)',
+                            (path, stat.st_size, stat.st_mtime_ns, content_hash))
+            self.db.commit()
+        return content_hash
+
+    def get(self, content_hash):
+        with self.lock:
+            row = self.db.execute('SELECT content_hash, path, remote_name, uri, state, size, uploaded, expires, '
+                                  'accessed FROM uploads WHERE content_hash = ?', (content_hash,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(['content_hash', 'path', 'remote_name', 'uri', 'state', 'size', 'uploaded', 'expires',
+                         'accessed'], row))
+
+    def put(self, content_hash, path, file):
+        now = time.time()
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO uploads VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                            (content_hash, os.path.abspath(path), file.name, getattr(file, 'uri', None),
+                             state_name(file), os.path.getsize(path), now, expiry_time(file, self.ttl), now))
+            self.db.commit()
+
+    def touch(self, content_hash, file=None):
+        with self.lock:
+            if file is None:
+                self.db.execute('UPDATE uploads SET accessed = ? WHERE content_hash = ?',
+                                (time.time(), content_hash))
+            else:
+                self.db.execute('UPDATE uploads SET accessed = ?, state = ? WHERE content_hash = ?',
+                                (time.time(), state_name(file), content_hash))
+            self.db.commit()
+
+    def remove(self, content_hash):
+        with self.lock:
+            self.db.execute('DELETE FROM uploads WHERE content_hash = ?', (content_hash,))
+            self.db.commit()
+
+    # Registered uploads, least recently used first.
+    def lru_entries(self):
+        with self.lock:
+            rows = self.db.execute('SELECT content_hash, remote_name, size FROM uploads ORDER BY accessed').fetchall()
+        return [dict(zip(['content_hash', 'remote_name', 'size'], row)) for row in rows]
+
+    # The live remote file recorded for `content_hash`, or None if there is none (never uploaded, expired,
+    # deleted or failed), in which case the stale entry is dropped.
+    def live_file(self, file_api, content_hash):
+        entry = self.get(content_hash)
+        if entry is None:
+            return None
+        if entry['expires'] <= time.time():
+            self.stats['expired'] += 1
+            self.remove(content_hash)
+            return None
+        try:
+            file = file_api.get_file(entry['remote_name'])
+        except Exception:
+            # Deleted or evicted from remote storage.
+            self.stats['missing'] += 1
+            self.remove(content_hash)
+            return None
+        if state_name(file) == 'FAILED':
+            self.remove(content_hash)
+            return None
+        self.touch(content_hash, file)
+        return file
+
+    # Remote file of a local video: the registered upload if it is still alive, otherwise a new upload,
+    # waited for until it has left the PROCESSING state (unless `wait` is false, see utils/upload_pipeline.py).
+    # before_upload(size), if given, is called before a new upload (see utils/remote_storage.py).
+    def ensure_uploaded(self, file_api, path, poll_interval=POLL_INTERVAL, before_upload=None, wait=True):
+        content_hash = self.content_hash(path)
+        file = self.live_file(file_api, content_hash)
+        if file is not None:
+            self.stats['reused'] += 1
+        else:
+            if before_upload is not None:
+                before_upload(os.path.getsize(path))
+            print('Uploading file', path)
+            file = file_api.upload_file(path=path)
+            print(f'Completed upload: {file.uri}')
+            self.stats['uploaded'] += 1
+            self.put(content_hash, path, file)
+        if not wait:
+            return file
+        while state_name(file) == 'PROCESSING':
+            time.sleep(poll_interval)
+            file = file_api.get_file(file.name)
+        return self.settle(content_hash, file)
+
+    # Record the state of a file that has left the PROCESSING state; raises ValueError if processing failed.
+    def settle(self, content_hash, file):
+        if state_name(file) == 'FAILED':
+            self.remove(content_hash)
+            raise ValueError(state_name(file))
+        self.touch(content_hash, file)
+        return file
+
+    def report(self):
+        return ', '.join('%s %d' % item for item in self.stats.items())
+
+    def close(self):
+        self.db.close()